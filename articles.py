@@ -0,0 +1,322 @@
+import asyncio
+import ipaddress
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode, urljoin
+
+import urllib3
+
+from metrics import span
+from utils import LazyEngine
+
+# Article fetch configuration
+ARTICLE_FRESH_SECONDS = int(os.environ.get("ARTICLE_FRESH_SECONDS", "900"))
+ARTICLE_FETCH_TIMEOUT = float(os.environ.get("ARTICLE_FETCH_TIMEOUT", "15"))
+ARTICLE_MAX_BYTES = int(os.environ.get("ARTICLE_MAX_BYTES", str(5 * 1024 * 1024)))
+ARTICLE_POOL_SIZE = int(os.environ.get("ARTICLE_POOL_SIZE", "4"))
+ARTICLE_ALLOW_PRIVATE_HOSTS = os.environ.get("ARTICLE_ALLOW_PRIVATE_HOSTS", "0") == "1"
+ARTICLE_MAX_REDIRECTS = 5
+
+USER_AGENT = "Mozilla/5.0 (compatible; PersonalizedNewsSummarizer/1.0)"
+
+# Query parameters that only track the visitor and never change the article
+TRACKING_PARAMS = re.compile(r'^(utm_\w+|fbclid|gclid|mc_cid|mc_eid|ref|ref_src)$', re.IGNORECASE)
+
+# Shared, bounded connection pool for all article downloads
+http = urllib3.PoolManager(
+    num_pools=50,
+    maxsize=ARTICLE_POOL_SIZE,
+    block=True,
+    timeout=urllib3.Timeout(connect=5, read=ARTICLE_FETCH_TIMEOUT),
+    retries=False,
+    headers={'User-Agent': USER_AGENT}
+)
+
+class ArticleFetchError(Exception):
+    """Raised when an article cannot be downloaded or extracted."""
+
+def normalize_url(url):
+    """Normalize a URL so equivalent spellings share one stored article."""
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    netloc = parsed.netloc.lower()
+    # Drop default ports
+    if (scheme == 'http' and netloc.endswith(':80')) or (scheme == 'https' and netloc.endswith(':443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if not TRACKING_PARAMS.match(key)
+    ))
+    return urlunparse((scheme, netloc, parsed.path or '/', parsed.params, query, ''))
+
+def title_from_url(url):
+    """Get a title from the URL (remove protocol and domain)."""
+    title = url
+    # Remove protocol
+    title = re.sub(r'^https?://', '', title)
+    # Remove domain
+    title = re.sub(r'^[^/]+/', '', title)
+    # Replace dashes with spaces and capitalize
+    title = ' '.join(word.capitalize() for word in title.replace('-', ' ').split())
+    return title[:100]  # Limit title length
+
+def check_host_allowed(url):
+    """Refuse to fetch from private, loopback or link-local addresses."""
+    if ARTICLE_ALLOW_PRIVATE_HOSTS:
+        return
+    host = urlparse(url).hostname
+    if not host:
+        raise ArticleFetchError("URL has no host")
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except socket.gaierror as e:
+        raise ArticleFetchError(f"Could not resolve host: {str(e)}")
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%')[0])
+        if ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved or ip.is_multicast:
+            raise ArticleFetchError("URL host is not allowed")
+
+# Unread response bodies up to this size are drained so the connection can be reused; larger ones close it
+DRAIN_MAX_BYTES = 64 * 1024
+
+def discard_body(response):
+    """Make a response's connection safe to return to the pool without its body having been read."""
+    remaining = response.length_remaining
+    if remaining is not None and remaining <= DRAIN_MAX_BYTES:
+        response.drain_conn()
+    else:
+        # Unknown (chunked) or large bodies are not worth reading; the pool reconnects instead
+        response.close()
+
+def http_get(url, headers=None):
+    """GET a URL through the shared pool, following redirects and capping the body size.
+
+    Returns (status, body, response_headers, final_url).
+    """
+    for _ in range(ARTICLE_MAX_REDIRECTS + 1):
+        check_host_allowed(url)
+        response = http.request('GET', url, headers=headers or {}, redirect=False, preload_content=False)
+        complete = False
+        try:
+            if response.status in (301, 302, 303, 307, 308) and response.headers.get('Location'):
+                url = urljoin(url, response.headers['Location'])
+                continue
+
+            body = b''
+            if response.status == 200:
+                for block in response.stream(64 * 1024):
+                    body += block
+                    if len(body) > ARTICLE_MAX_BYTES:
+                        raise ArticleFetchError("Article is too large")
+                complete = True
+            return response.status, body, response.headers, url
+        finally:
+            # Otherwise the next request on this keep-alive connection would read the leftover body
+            if not complete:
+                discard_body(response)
+            response.release_conn()
+    raise ArticleFetchError("Too many redirects")
+
+class ArticleStore(LazyEngine):
+    """Database-backed store of fetched HTML, extracted text and validators."""
+
+    def __init__(self):
+        self.app = None
+        self.db = None
+        self.model = None
+
+    def init_app(self, app, db, model):
+        """Attach the article table."""
+        self.app = app
+        self.db = db
+        self.model = model
+
+    def get(self, url):
+        if self.db is None:
+            return None
+        table = self.model.__table__
+        with self.engine.connect() as conn:
+            row = conn.execute(table.select().where(table.c.url == url)).first()
+        return dict(row._mapping) if row is not None else None
+
+    def save(self, url, **fields):
+        if self.db is None:
+            return
+        table = self.model.__table__
+        with self.engine.begin() as conn:
+            updated = conn.execute(table.update().where(table.c.url == url).values(**fields)).rowcount
+            if not updated:
+                conn.execute(table.insert().values(url=url, **fields))
+
+# Shared article store
+article_store = ArticleStore()
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def _single_flight(key, load):
+    """Run load() once per key at a time; concurrent callers share its result."""
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            _inflight[key] = future
+
+    if not is_leader:
+        return future.result()
+
+    try:
+        result = load()
+        future.set_result(result)
+        return result
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+_extractor = None
+
+def get_extractor():
+    """Return trafilatura's (extract, decode_file), importing it on first use rather than at startup."""
+    global _extractor
+    if _extractor is None:
+        import trafilatura
+        from trafilatura.utils import decode_file
+        _extractor = (trafilatura.extract, decode_file)
+    return _extractor
+
+def _is_fresh(stored, now):
+    return stored is not None and now - stored['checked_at'] < ARTICLE_FRESH_SECONDS
+
+def _conditional_headers(stored):
+    headers = {}
+    if stored and stored.get('etag'):
+        headers['If-None-Match'] = stored['etag']
+    if stored and stored.get('last_modified'):
+        headers['If-Modified-Since'] = stored['last_modified']
+    return headers
+
+def _load_article(url):
+    """Return a stored article, revalidating it with a conditional GET when stale."""
+    stored = article_store.get(url)
+    now = time.time()
+    if _is_fresh(stored, now):
+        return stored
+
+    with span("fetch"):
+        status, body, response_headers, final_url = http_get(url, _conditional_headers(stored))
+    return _store_response(url, stored, now, status, body, response_headers, final_url)
+
+def _store_response(url, stored, now, status, body, response_headers, final_url):
+    """Turn a download into the stored article: refresh it on 304, extract and save it on 200."""
+    if status == 304 and stored:
+        article_store.save(url, checked_at=now)
+        stored['checked_at'] = now
+        return stored
+    if status != 200 or not body:
+        raise ArticleFetchError("Failed to download content from URL")
+
+    extract, decode_file = get_extractor()
+    with span("extract"):
+        raw_html = decode_file(body)
+        text = extract(raw_html, url=final_url)
+    if not text:
+        raise ArticleFetchError("No content extracted from URL")
+
+    article = {
+        'url': url,
+        'title': title_from_url(url),
+        'raw_html': raw_html,
+        'text': text,
+        'etag': response_headers.get('ETag'),
+        'last_modified': response_headers.get('Last-Modified'),
+        'fetched_at': now,
+        'checked_at': now
+    }
+    article_store.save(url, **{key: value for key, value in article.items() if key != 'url'})
+    return article
+
+async def http_get_async(client, url, headers=None):
+    """http_get over an httpx.AsyncClient, for the ASGI entry point."""
+    for _ in range(ARTICLE_MAX_REDIRECTS + 1):
+        await asyncio.to_thread(check_host_allowed, url)
+        async with client.stream('GET', url, headers=headers or {}, follow_redirects=False) as response:
+            if response.status_code in (301, 302, 303, 307, 308) and response.headers.get('Location'):
+                url = urljoin(url, response.headers['Location'])
+                continue
+
+            body = b''
+            if response.status_code == 200:
+                async for block in response.aiter_bytes(64 * 1024):
+                    body += block
+                    if len(body) > ARTICLE_MAX_BYTES:
+                        raise ArticleFetchError("Article is too large")
+            return response.status_code, body, response.headers, url
+    raise ArticleFetchError("Too many redirects")
+
+async def _load_article_async(client, url):
+    # Only the download waits on the event loop; the store and trafilatura run in threads
+    stored = await asyncio.to_thread(article_store.get, url)
+    now = time.time()
+    if _is_fresh(stored, now):
+        return stored
+
+    with span("fetch"):
+        status, body, response_headers, final_url = await http_get_async(client, url, _conditional_headers(stored))
+    return await asyncio.to_thread(_store_response, url, stored, now, status, body, response_headers, final_url)
+
+_inflight_async = {}
+
+async def fetch_article_async(client, url):
+    """Async fetch_article; concurrent fetches of one URL on the event loop share one download."""
+    url = normalize_url(url)
+    task = _inflight_async.get(url)
+    if task is None:
+        task = asyncio.ensure_future(_load_article_async(client, url))
+        _inflight_async[url] = task
+        task.add_done_callback(lambda _: _inflight_async.pop(url, None))
+    # A cancelled caller must not cancel the download other callers are waiting on
+    return await asyncio.shield(task)
+
+def fetch_article(url):
+    """Fetch an article by URL, collapsing concurrent fetches of the same URL."""
+    url = normalize_url(url)
+    return _single_flight(url, lambda: _load_article(url))
+
+def extract_article_from_url(url):
+    """Extract article content from a URL using trafilatura."""
+    try:
+        article = fetch_article(url)
+        return {
+            'title': article['title'],
+            'text': article['text'],
+            'url': article['url']
+        }, None
+    except ArticleFetchError as e:
+        return None, str(e)
+    except Exception as e:
+        logging.error(f"Error extracting article: {str(e)}")
+        return None, f"Error processing URL: {str(e)}"
+
+async def extract_article_from_url_async(client, url):
+    """Async extract_article_from_url."""
+    try:
+        article = await fetch_article_async(client, url)
+        return {
+            'title': article['title'],
+            'text': article['text'],
+            'url': article['url']
+        }, None
+    except ArticleFetchError as e:
+        return None, str(e)
+    except Exception as e:
+        logging.error(f"Error extracting article: {str(e)}")
+        return None, f"Error processing URL: {str(e)}"
@@ -0,0 +1,235 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+import httpx
+from a2wsgi import WSGIMiddleware
+
+import async_summarizer
+from articles import ARTICLE_FETCH_TIMEOUT, ARTICLE_POOL_SIZE, USER_AGENT, extract_article_from_url_async
+from budget import token_budget
+from main import (
+    MAX_INPUT_BYTES, app, db, Summary, User, clean_text, find_summary, get_summary_engine, is_valid_url,
+    remember_summary
+)
+from metrics import end_trace, http_request_seconds, server_timing, span, start_trace
+from ratelimit import rate_limiter
+
+# Async serving: `uvicorn asgi:application`. POST /api/summarize runs on the event loop, so one
+# process holds many in-flight summaries; every other route is the Flask app on a thread pool.
+ASGI_MAX_INFLIGHT = int(os.environ.get("ASGI_MAX_INFLIGHT", "500"))
+ASGI_WSGI_THREADS = int(os.environ.get("ASGI_WSGI_THREADS", "16"))
+ASGI_MAX_BODY_BYTES = int(os.environ.get("ASGI_MAX_BODY_BYTES", str(MAX_INPUT_BYTES)))
+# Concurrent article downloads per process (the sync path is bounded by ARTICLE_POOL_SIZE per worker)
+ASGI_FETCH_CONNECTIONS = int(os.environ.get("ASGI_FETCH_CONNECTIONS", str(ARTICLE_POOL_SIZE * 25)))
+
+class RequestError(Exception):
+    """Rejects an API request with an HTTP status and message."""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or []
+
+class AsyncSummarizer:
+    """ASGI application: native async summarization, everything else delegated to Flask."""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WSGIMiddleware(flask_app, workers=ASGI_WSGI_THREADS)
+        self.http = None
+        self.slots = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and scope['path'] == '/api/summarize' and scope['method'] == 'POST':
+            return await self.summarize(scope, receive, send)
+        return await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.http is not None:
+                    await self.http.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def start(self):
+        """Create the shared download client and in-flight limit inside the serving event loop."""
+        if self.http is None:
+            self.http = httpx.AsyncClient(
+                timeout=httpx.Timeout(ARTICLE_FETCH_TIMEOUT, connect=5),
+                limits=httpx.Limits(max_connections=ASGI_FETCH_CONNECTIONS),
+                headers={'User-Agent': USER_AGENT}
+            )
+            self.slots = asyncio.Semaphore(ASGI_MAX_INFLIGHT)
+
+    async def summarize(self, scope, receive, send):
+        """POST /api/summarize: JSON or form fields url or text_input, plus optional title and settings."""
+        self.start()
+        started = time.perf_counter()
+        trace = start_trace()
+        headers = []
+        try:
+            async with self.slots:
+                user = await self.authenticate(scope)
+                fields = await read_fields(scope, receive)
+                status, payload = 200, await self.run_summary(user, fields)
+        except RequestError as e:
+            status, payload, headers = e.status, {'error': str(e)}, e.headers
+        except Exception as e:
+            logging.error(f"Async summarization failed: {str(e)}")
+            status, payload = 500, {'error': 'Internal server error'}
+
+        spans = end_trace(trace)
+        if spans:
+            headers.append((b'server-timing', server_timing(spans).encode('ascii')))
+        http_request_seconds.observe(
+            time.perf_counter() - started, endpoint='api_summarize', method='POST', status=status
+        )
+        await send_json(send, status, payload, headers)
+
+    async def authenticate(self, scope):
+        """Load the logged-in user from the Flask session cookie."""
+        user_id = self.session_user_id(scope)
+        user = await asyncio.to_thread(load_user_settings, user_id) if user_id else None
+        if user is None:
+            raise RequestError(401, 'Authentication required')
+        return user
+
+    def session_user_id(self, scope):
+        cookie = SimpleCookie()
+        for name, value in scope['headers']:
+            if name == b'cookie':
+                cookie.load(value.decode('latin-1'))
+        morsel = cookie.get(self.flask_app.config['SESSION_COOKIE_NAME'])
+        if morsel is None:
+            return None
+        serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+        try:
+            max_age = int(self.flask_app.permanent_session_lifetime.total_seconds())
+            return serializer.loads(morsel.value, max_age=max_age).get('user_id')
+        except Exception:
+            return None
+
+    async def run_summary(self, user, fields):
+        allowed, retry_after = await asyncio.to_thread(rate_limiter.check, user['id'])
+        if not allowed:
+            raise RequestError(429, 'Rate limit exceeded', [(b'retry-after', str(int(retry_after) + 1).encode('ascii'))])
+
+        summary_length = fields.get('summary_length') or user['summary_length']
+        reading_level = fields.get('reading_level') or user['reading_level']
+        engine = get_summary_engine(fields.get('summary_engine'), user['summary_engine'])
+        engine = await asyncio.to_thread(token_budget.engine_for, user['id'], engine)
+        interests = user['interests']
+
+        url = fields.get('url')
+        if url:
+            if not is_valid_url(url):
+                raise RequestError(400, 'Invalid URL format')
+            article, error = await extract_article_from_url_async(self.http, url)
+            if error:
+                raise RequestError(422, f'Error extracting article: {error}')
+            title, original_text, source_url = article['title'], article['text'], article['url']
+        else:
+            original_text = fields.get('text_input')
+            if not original_text:
+                raise RequestError(400, 'URL or text content is required')
+            title, source_url = fields.get('title') or 'Custom Text', None
+
+        async with token_budget.ameter(user['id']):
+            cleaned_text = await asyncio.to_thread(clean_text, original_text)
+            result, keys = await asyncio.to_thread(
+                find_summary, cleaned_text, summary_length, reading_level, interests, engine
+            )
+            if result is None:
+                result = await async_summarizer.generate_summary(
+                    cleaned_text, summary_length, reading_level, interests, engine
+                )
+                await asyncio.to_thread(remember_summary, keys, result)
+
+        summary_id = await asyncio.to_thread(save_summary, {
+            'title': title,
+            'original_text': original_text,
+            'summarized_text': result['summary'],
+            'source_url': source_url,
+            'summary_length': summary_length,
+            'reading_level': reading_level,
+            'key_topics': ','.join(result['key_topics']),
+            'user_id': user['id'],
+        })
+        return {
+            'summary_id': summary_id,
+            'summary': result['summary'],
+            'key_topics': result['key_topics'],
+            'summary_url': f"/summary/{summary_id}",
+        }
+
+def load_user_settings(user_id):
+    """The user's id and summary settings as plain values, or None."""
+    with app.app_context():
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        return {
+            'id': user.id,
+            'reading_level': user.reading_level,
+            'summary_length': user.summary_length,
+            'summary_engine': user.summary_engine,
+            'interests': user.get_interests_list(),
+        }
+
+def save_summary(fields):
+    with app.app_context():
+        summary = Summary(**fields)
+        db.session.add(summary)
+        with span("db_commit"):
+            db.session.commit()
+        return summary.id
+
+async def read_fields(scope, receive):
+    """Read a JSON or form-encoded body, refusing bodies over ASGI_MAX_BODY_BYTES before buffering them."""
+    headers = dict(scope['headers'])
+    # A declared length over the limit is refused without reading anything
+    if int(headers.get(b'content-length', b'0') or 0) > ASGI_MAX_BODY_BYTES:
+        raise RequestError(413, 'Request body is too large')
+
+    body = b''
+    more = True
+    while more:
+        message = await receive()
+        body += message.get('body', b'')
+        more = message.get('more_body', False)
+        if len(body) > ASGI_MAX_BODY_BYTES:
+            raise RequestError(413, 'Request body is too large')
+
+    content_type = headers.get(b'content-type', b'').decode('latin-1')
+    try:
+        if content_type.startswith('application/json'):
+            fields = json.loads(body or b'{}')
+            if not isinstance(fields, dict):
+                raise ValueError("expected a JSON object")
+            return fields
+        return {key: values[0] for key, values in parse_qs(body.decode('utf-8')).items()}
+    except ValueError as e:
+        raise RequestError(400, f'Malformed request body: {str(e)}')
+
+async def send_json(send, status, payload, headers=()):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode('ascii'))] + list(headers),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+application = AsyncSummarizer(app)
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+
+from cache import summary_cache
+from chunking import CHUNK_TOKENS, MAX_INPUT_TOKENS, chunk_cache, count_tokens, make_chunk_key, split_into_chunks
+from highlight import highlight_interests
+from llm import get_backend, model_for
+from metrics import span
+from summarizer import (
+    BASE_LENGTH, BASE_READING_LEVEL, CHUNK_SUMMARY_TOKENS, SUMMARY_MODE, build_chunk_prompt, build_combined_prompt,
+    build_summary_prompt, build_topics_prompt, build_variant_prompt, extract_key_topics_basic,
+    generate_basic_summary, local_topics_ready, make_base_key, parse_combined, parse_topics
+)
+
+# The same pipeline as summarizer.generate_summary for the ASGI entry point: LLM calls are awaited
+# on the event loop, while CPU-bound or blocking work (tokenizing, extractive engine, local topics and their
+# statistics, cache DB tier) runs in threads
+
+async def extract_key_topics(text, n=5):
+    """Async extract_key_topics_with_ai."""
+    try:
+        with span("topics"):
+            completion = await get_backend().acomplete(build_topics_prompt(text, n), max_tokens=200, json_mode=True)
+        # Malformed output falls back to local topics, which read the topic statistics
+        return await asyncio.to_thread(parse_topics, completion.text, text, n)
+    except Exception as e:
+        logging.error(f"AI key topics extraction failed: {str(e)}")
+        return await asyncio.to_thread(extract_key_topics_basic, text, n)
+
+async def summarize_chunk(chunk):
+    """Async summarize_chunk_with_ai, sharing its chunk cache."""
+    cache_key = make_chunk_key(chunk)
+    cached = await asyncio.to_thread(chunk_cache.get, cache_key)
+    if cached is not None:
+        return cached['summary']
+
+    with span("chunk_summary"):
+        completion = await get_backend().acomplete(
+            build_chunk_prompt(chunk), max_tokens=CHUNK_SUMMARY_TOKENS, temperature=0.3
+        )
+    summary_text = completion.text.strip()
+    await asyncio.to_thread(chunk_cache.set, cache_key, {'summary': summary_text, 'key_topics': []})
+    return summary_text
+
+async def reduce_long_text(text, max_rounds=3):
+    """Async reduce_long_text: the chunk summaries of a round run concurrently."""
+    for _ in range(max_rounds):
+        if await asyncio.to_thread(count_tokens, text) <= MAX_INPUT_TOKENS:
+            break
+        chunks = await asyncio.to_thread(split_into_chunks, text, CHUNK_TOKENS)
+        text = "\n\n".join(await asyncio.gather(*(summarize_chunk(chunk) for chunk in chunks)))
+    return text
+
+async def generate_ai_summary(text, length="medium", reading_level="medium", interests=None):
+    """Async generate_ai_summary."""
+    try:
+        with span("summary"):
+            completion = await get_backend().acomplete(
+                build_summary_prompt(text, length, reading_level, interests),
+                max_tokens=800,
+                temperature=0.7,
+                model=model_for(length)
+            )
+        return highlight_interests(completion.text.strip(), interests)
+    except Exception as e:
+        logging.error(f"AI summary generation failed: {str(e)}")
+        return await asyncio.to_thread(generate_basic_summary, text, length, reading_level, interests)
+
+async def generate_base_summary(text):
+    """Async summarizer.generate_base_summary, sharing its cache."""
+    cache_key = make_base_key(text)
+    cached = await asyncio.to_thread(summary_cache.get, cache_key)
+    if cached is not None:
+        return cached['summary']
+
+    prompt = build_summary_prompt(await reduce_long_text(text), BASE_LENGTH, BASE_READING_LEVEL)
+    with span("base_summary"):
+        completion = await get_backend().acomplete(
+            prompt, max_tokens=800, temperature=0.3, model=model_for(BASE_LENGTH)
+        )
+    base_summary = completion.text.strip()
+    await asyncio.to_thread(summary_cache.set, cache_key, {'summary': base_summary, 'key_topics': []})
+    return base_summary
+
+async def derive_summary(base_summary, length="medium", reading_level="medium", interests=None):
+    """Async summarizer.derive_summary."""
+    if length == BASE_LENGTH and reading_level == BASE_READING_LEVEL and not interests:
+        return base_summary
+    try:
+        with span("variant"):
+            completion = await get_backend().acomplete(
+                build_variant_prompt(base_summary, length, reading_level, interests),
+                max_tokens=600,
+                temperature=0.5,
+                model=model_for(length)
+            )
+        return highlight_interests(completion.text.strip(), interests)
+    except Exception as e:
+        logging.error(f"Summary variant generation failed: {str(e)}")
+        return await asyncio.to_thread(generate_basic_summary, base_summary, length, reading_level, interests)
+
+async def generate_derived_summary(text, length="medium", reading_level="medium", interests=None):
+    """Async summarizer.generate_derived_summary."""
+    if await asyncio.to_thread(local_topics_ready):
+        key_topics, base_summary = await asyncio.gather(
+            asyncio.to_thread(extract_key_topics_basic, text),
+            generate_base_summary(text)
+        )
+        summary_text = await derive_summary(base_summary, length, reading_level, interests)
+    else:
+        base_summary = await generate_base_summary(text)
+        key_topics, summary_text = await asyncio.gather(
+            extract_key_topics(base_summary),
+            derive_summary(base_summary, length, reading_level, interests)
+        )
+    return {
+        'summary': summary_text,
+        'key_topics': key_topics
+    }
+
+async def generate_summary(text, length="medium", reading_level="medium", interests=None, engine="ai"):
+    """Async summarizer.generate_summary; text must already be cleaned."""
+    if engine == "extractive":
+        return await asyncio.to_thread(basic_result, text, length, reading_level, interests)
+
+    try:
+        if SUMMARY_MODE == "derived":
+            return await generate_derived_summary(text, length, reading_level, interests)
+
+        reduced_text = await reduce_long_text(text)
+
+        if await asyncio.to_thread(local_topics_ready):
+            key_topics, summary_text = await asyncio.gather(
+                asyncio.to_thread(extract_key_topics_basic, text),
+                generate_ai_summary(reduced_text, length, reading_level, interests)
+            )
+            return {
+                'summary': summary_text,
+                'key_topics': key_topics
+            }
+
+        if SUMMARY_MODE == "combined":
+            try:
+                with span("combined"):
+                    completion = await get_backend().acomplete(
+                        build_combined_prompt(reduced_text, length, reading_level, interests),
+                        max_tokens=1000,
+                        temperature=0.7,
+                        json_mode=True,
+                        model=model_for(length)
+                    )
+                return await asyncio.to_thread(parse_combined, completion.text, reduced_text, interests)
+            except ValueError as e:
+                logging.error(f"Combined AI summary returned malformed output: {str(e)}")
+
+        key_topics, summary_text = await asyncio.gather(
+            extract_key_topics(reduced_text),
+            generate_ai_summary(reduced_text, length, reading_level, interests)
+        )
+        return {
+            'summary': summary_text,
+            'key_topics': key_topics
+        }
+    except Exception as e:
+        logging.error(f"Error in AI summary generation: {str(e)}")
+        return await asyncio.to_thread(basic_result, text, length, reading_level, interests)
+
+def basic_result(text, length, reading_level, interests):
+    """Extractive summary and frequency topics, for running in a worker thread."""
+    return {
+        'summary': generate_basic_summary(text, length, reading_level, interests),
+        'key_topics': extract_key_topics_basic(text)
+    }
@@ -0,0 +1,59 @@
+import contextvars
+import os
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+from articles import normalize_url
+
+# Batch configuration
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "20"))
+BATCH_MAX_WORKERS = int(os.environ.get("BATCH_MAX_WORKERS", "8"))
+BATCH_PER_HOST_LIMIT = int(os.environ.get("BATCH_PER_HOST_LIMIT", "2"))
+
+def dedupe_urls(urls):
+    """Return normalized URLs in their original order without duplicates."""
+    seen = set()
+    unique = []
+    for url in urls:
+        if not url or not url.strip():
+            continue
+        normalized = normalize_url(url)
+        if normalized not in seen:
+            seen.add(normalized)
+            unique.append(normalized)
+    return unique
+
+class HostLimiter:
+    """Cap the number of concurrent requests made to any single host."""
+
+    def __init__(self, per_host_limit=BATCH_PER_HOST_LIMIT):
+        self.per_host_limit = per_host_limit
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def for_url(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._semaphores[host]
+
+def run_batch(items, process_item, max_workers=BATCH_MAX_WORKERS, per_host_limit=BATCH_PER_HOST_LIMIT):
+    """Process batch items concurrently and yield (index, result) as each one finishes.
+
+    process_item(item, host_slot) must not raise. Items with a 'url' key get their host's semaphore as
+    host_slot, to hold only while downloading; summarizing runs outside it at full pool concurrency.
+    """
+    limiter = HostLimiter(per_host_limit)
+
+    def run(item):
+        host_slot = limiter.for_url(item['url']) if item.get('url') else nullcontext()
+        return process_item(item, host_slot)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+        # Each item runs in a copy of the caller's context so its LLM usage is metered to the caller
+        futures = {pool.submit(contextvars.copy_context().run, run, item): index for index, item in enumerate(items)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
@@ -0,0 +1 @@
+"""Reproducible benchmarks for the summarizer and the Flask app. Run with `python -m benchmarks.run`."""
@@ -0,0 +1,47 @@
+import argparse
+import json
+import sys
+
+def flatten(results):
+    """Yield (benchmark name, stats) for every timed case in a result file."""
+    for name, by_size in results.get('micro', {}).items():
+        for size, stats in by_size.items():
+            yield f"micro.{name}.{size}", stats
+    for name, stats in results.get('endpoints', {}).items():
+        yield f"endpoints.{name}", stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files and flag regressions.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--metric", default="p50_ms", help="statistic to compare (default: p50_ms)")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown counted as a regression")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline_results = json.load(f)
+    with open(args.candidate) as f:
+        candidate_results = json.load(f)
+    if baseline_results.get('settings') != candidate_results.get('settings'):
+        print("Warning: the runs used different settings; endpoint numbers may not be comparable")
+    baseline = dict(flatten(baseline_results))
+    candidate = dict(flatten(candidate_results))
+
+    regressions = 0
+    print(f"{'benchmark':<50} {'baseline':>10} {'candidate':>10} {'change':>8}")
+    for name in sorted(baseline.keys() & candidate.keys()):
+        before = baseline[name][args.metric]
+        after = candidate[name][args.metric]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > args.threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"{name:<50} {before:>10.3f} {after:>10.3f} {change:>+8.1%}{flag}")
+
+    if regressions:
+        print(f"{regressions} benchmark(s) slower by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
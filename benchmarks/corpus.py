@@ -0,0 +1,41 @@
+import random
+
+# Vocabulary mixing common words with topical terms the interest highlighter looks for
+WORDS = """
+the a of and to in is that for on with as by at from it was were be has have said will would could about
+after over into than more most new first last year years week government market company companies report
+officials data research study scientists technology science health business politics sports economy
+energy climate election policy court city state national global industry investors growth prices
+people public school university hospital patients players season team league budget security network
+software device launch announced according analysis percent million billion record quarter
+""".split()
+
+CAPITALIZED = "Reuters Washington London Europe Congress Google Apple Tuesday Friday Senate NASA".split()
+
+def make_sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 28))]
+    if rng.random() < 0.3:
+        words.insert(rng.randint(0, len(words)), rng.choice(CAPITALIZED))
+    words[0] = words[0].capitalize()
+    return " ".join(words) + rng.choice(".....?!")
+
+def make_article(size_bytes, seed=0):
+    """Deterministic article-like text of roughly size_bytes, with the URLs, tags and spacing clean_text removes."""
+    rng = random.Random(seed)
+    paragraphs = []
+    size = 0
+    while size < size_bytes:
+        sentences = [make_sentence(rng) for _ in range(rng.randint(3, 7))]
+        if rng.random() < 0.1:
+            sentences.append(f"Read more at https://example.com/news/{rng.randint(1, 10**6)}")
+        if rng.random() < 0.05:
+            sentences[0] = f"<p>{sentences[0]}</p>"
+        paragraph = "  ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)[:size_bytes]
+
+def size_label(size_bytes):
+    if size_bytes >= 1024 * 1024:
+        return f"{size_bytes // (1024 * 1024)}MB"
+    return f"{size_bytes // 1024}KB"
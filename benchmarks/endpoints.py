@@ -0,0 +1,113 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.corpus import make_article
+from benchmarks.timing import describe
+
+BENCH_PASSWORD = "bench-password"
+
+def seed_database(users=100, summaries_per_user=50, article_bytes=4096, seed=0):
+    """Fill the configured database with users and summaries of realistic size. Returns the seeded user names."""
+    from werkzeug.security import generate_password_hash
+    from main import app, db, User, Summary
+
+    rng = random.Random(seed)
+    # Hashing is deliberately slow, so every seeded user shares one hash
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    interests = ["technology", "science", "health", "business", "politics", "sports", "general"]
+
+    usernames = []
+    with app.app_context():
+        for user_index in range(users):
+            user = User(
+                username=f"bench{user_index}",
+                email=f"bench{user_index}@example.com",
+                password_hash=password_hash,
+                interests=','.join(rng.sample(interests, 2))
+            )
+            db.session.add(user)
+            db.session.flush()
+            for summary_index in range(summaries_per_user):
+                text = make_article(article_bytes, seed=user_index * summaries_per_user + summary_index)
+                db.session.add(Summary(
+                    title=text[:80],
+                    original_text=text,
+                    summarized_text=' '.join(text.split()[:120]),
+                    source_url=f"https://example.com/news/{user_index}/{summary_index}",
+                    key_topics="technology,science,market,policy,health",
+                    user_id=user.id
+                ))
+            db.session.commit()
+            usernames.append(user.username)
+    return usernames
+
+def logged_in_client(username):
+    from main import app
+
+    client = app.test_client()
+    response = client.post('/login', data={'username': username, 'password': BENCH_PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError(f"Could not log in as {username}")
+    return client
+
+def summary_ids_for(username):
+    from main import app, db, User, Summary
+
+    with app.app_context():
+        user_id = db.session.execute(db.select(User.id).where(User.username == username)).scalar_one()
+        return list(db.session.execute(db.select(Summary.id).where(Summary.user_id == user_id)).scalars())
+
+def run_requests(clients, make_request, requests):
+    """Issue requests round-robin over clients, one thread per client, and describe their latencies."""
+    def worker(client_index):
+        client = clients[client_index]
+        samples = []
+        for request_index in range(client_index, requests, len(clients)):
+            started = time.perf_counter()
+            response = make_request(client, request_index)
+            samples.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                raise RuntimeError(f"Request failed with {response.status_code}")
+        return samples
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+        samples = [sample for result in pool.map(worker, range(len(clients))) for sample in result]
+    return describe(samples, wall_seconds=time.perf_counter() - started)
+
+def run_endpoints(usernames, requests=200, concurrency=1, article_bytes=4096):
+    """Measure end-to-end latency percentiles and throughput of the main pages."""
+    clients = [logged_in_client(usernames[index % len(usernames)]) for index in range(concurrency)]
+    summary_ids = {id(client): summary_ids_for(usernames[index % len(usernames)]) for index, client in enumerate(clients)}
+
+    # Generated up front so text generation is not timed
+    articles = [make_article(article_bytes, seed=10**6 + index) for index in range(requests + 1)]
+
+    def summarize(engine, unique):
+        def make_request(client, request_index):
+            # Unique input misses every cache; repeated input measures the cached path
+            return client.post('/summarize', data={
+                'content_type': 'text',
+                'title': 'Benchmark article',
+                'text_input': articles[request_index if unique else 0],
+                'summary_engine': engine
+            })
+        return make_request
+
+    cases = {
+        'summarize_ai': summarize("ai", unique=True),
+        'summarize_extractive': summarize("extractive", unique=True),
+        'summarize_cached': summarize("ai", unique=False),
+        'profile': lambda client, request_index: client.get('/profile'),
+        'view_summary': lambda client, request_index: client.get(
+            f"/summary/{summary_ids[id(client)][request_index % len(summary_ids[id(client)])]}"
+        ),
+    }
+
+    results = {}
+    for name, make_request in cases.items():
+        # One untimed request, outside the timed index range, warms templates and connections
+        make_request(clients[0], requests)
+        results[name] = run_requests(clients, make_request, requests)
+    return results
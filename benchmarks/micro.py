@@ -0,0 +1,31 @@
+from benchmarks.corpus import make_article, size_label
+from benchmarks.timing import measure
+
+# Corpus sizes from a short post to a very long document
+SIZES = (1024, 10 * 1024, 100 * 1024, 1024 * 1024)
+QUICK_SIZES = (1024, 10 * 1024, 100 * 1024)
+
+INTERESTS = ["technology", "science", "health", "climate", "election"]
+
+def run_micro(sizes=SIZES, budget_seconds=2.0):
+    """Time the text pipeline functions on each corpus size. Returns {benchmark: {size: stats}}."""
+    # Import here so the runner can configure the environment first
+    from summarizer import clean_text, extract_key_topics_basic, generate_basic_summary
+    from highlight import highlight_interests
+
+    results = {}
+    for size in sizes:
+        text = make_article(size, seed=size)
+        cleaned = clean_text(text)
+        # Everything after clean_text works on the cleaned copy, as in the app
+        cases = {
+            'clean_text': lambda: clean_text(text),
+            'generate_basic_summary': lambda: generate_basic_summary(cleaned, "medium", "medium", INTERESTS),
+            'extract_key_topics_basic': lambda: extract_key_topics_basic(cleaned),
+            'highlight_interests': lambda: highlight_interests(cleaned, INTERESTS),
+        }
+        for name, fn in cases.items():
+            stats = measure(fn, budget_seconds=budget_seconds)
+            stats['input_bytes'] = len(text.encode('utf-8'))
+            results.setdefault(name, {})[size_label(size)] = stats
+    return results
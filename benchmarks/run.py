@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+def configure_environment(database_url):
+    """Point the app at a scratch database and the offline LLM backend before anything imports main."""
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("LLM_BACKEND", "fake")
+    os.environ.setdefault("LLM_FAKE_LATENCY_MS", "0")
+    # Limits and budgets would otherwise throttle the load generator
+    os.environ.setdefault("RATE_LIMIT_PER_MINUTE", "0")
+    os.environ.setdefault("USER_DAILY_TOKEN_BUDGET", "0")
+    os.environ.setdefault("GLOBAL_DAILY_TOKEN_BUDGET", "0")
+    os.environ.setdefault("JOB_QUEUE_ENABLED", "0")
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the summarizer and endpoint benchmarks and write the results as JSON.")
+    parser.add_argument("--only", choices=["micro", "endpoints", "startup"], help="run one group of benchmarks")
+    parser.add_argument("--quick", action="store_true", help="smaller corpora, database and request counts")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--summaries-per-user", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrent test clients")
+    parser.add_argument("--database-url", help="benchmark against this database instead of a scratch SQLite file")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.users, args.summaries_per_user, args.requests = 10, 10, 30
+
+    scratch = None
+    if args.database_url is None:
+        scratch = tempfile.mkdtemp(prefix="bench-")
+        args.database_url = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+    configure_environment(args.database_url)
+
+    # Import here so the settings above are in place when the app modules load
+    from benchmarks.endpoints import run_endpoints, seed_database
+    from benchmarks.micro import QUICK_SIZES, SIZES, run_micro
+    from benchmarks.startup import run_startup
+    from main import init_db
+
+    init_db()
+
+    results = {
+        'revision': git_revision(),
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'settings': {
+            'users': args.users,
+            'summaries_per_user': args.summaries_per_user,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'database': 'scratch sqlite' if scratch else 'custom',
+        },
+    }
+
+    if args.only in (None, "startup"):
+        print("Measuring cold starts...", file=sys.stderr)
+        results['startup'] = run_startup(runs=3 if args.quick else 5)
+    if args.only in (None, "micro"):
+        print("Running micro-benchmarks...", file=sys.stderr)
+        results['micro'] = run_micro(QUICK_SIZES if args.quick else SIZES, budget_seconds=0.5 if args.quick else 2.0)
+    if args.only in (None, "endpoints"):
+        print(f"Seeding {args.users} users x {args.summaries_per_user} summaries...", file=sys.stderr)
+        seeding_started = time.perf_counter()
+        usernames = seed_database(args.users, args.summaries_per_user)
+        results['seed_seconds'] = round(time.perf_counter() - seeding_started, 2)
+        print("Running endpoint benchmarks...", file=sys.stderr)
+        results['endpoints'] = run_endpoints(usernames, args.requests, args.concurrency)
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results", time.strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Runs in a fresh interpreter so every import is cold
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+if sys.argv[1] == "warm":
+    main.warm_up()
+warmed = time.perf_counter()
+with main.app.app_context():
+    main.generate_summary(sys.argv[2], engine="extractive")
+done = time.perf_counter()
+print(json.dumps({
+    'import_seconds': imported - started,
+    'warm_up_seconds': warmed - imported,
+    'first_summary_seconds': done - warmed,
+}))
+"""
+
+def probe(mode, text):
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE, mode, text],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def run_startup(runs=5):
+    """Median cold-start timings of a worker that stays lazy versus one that warms up before serving."""
+    from benchmarks.corpus import make_article
+
+    results = {}
+    for mode in ("lazy", "warm"):
+        samples = []
+        for run in range(runs):
+            # A fresh article each run keeps the summary cache out of the measurement
+            samples.append(probe(mode, make_article(4096, seed=2 * 10**6 + run + (runs if mode == "warm" else 0))))
+        results[mode] = {
+            key.replace('_seconds', '_ms'): round(statistics.median(sample[key] for sample in samples) * 1000, 1)
+            for key in ('import_seconds', 'warm_up_seconds', 'first_summary_seconds')
+        }
+    return results
@@ -0,0 +1,35 @@
+import statistics
+import time
+
+def describe(samples, wall_seconds=None):
+    """Summarize per-call timings (seconds) as milliseconds, percentiles and throughput."""
+    ordered = sorted(samples)
+
+    def percentile(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    result = {
+        'runs': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'p50_ms': round(percentile(0.50), 3),
+        'p90_ms': round(percentile(0.90), 3),
+        'p95_ms': round(percentile(0.95), 3),
+        'p99_ms': round(percentile(0.99), 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+    total = wall_seconds if wall_seconds is not None else sum(ordered)
+    result['per_second'] = round(len(ordered) / total, 2) if total else None
+    return result
+
+def measure(fn, min_runs=5, max_runs=200, budget_seconds=2.0, warmup=1):
+    """Call fn() repeatedly until max_runs or the time budget is spent (at least min_runs) and describe the timings."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < max_runs and (len(samples) < min_runs or time.perf_counter() - started < budget_seconds):
+        call_started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - call_started)
+    return describe(samples)
@@ -0,0 +1,82 @@
+import logging
+import os
+import threading
+import time
+
+# Circuit breaker configuration
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_SLOW_THRESHOLD = int(os.environ.get("BREAKER_SLOW_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.environ.get("BREAKER_RESET_TIMEOUT", "30"))
+# Calls slower than this many seconds count against the latency SLO
+LLM_LATENCY_SLO = float(os.environ.get("LLM_LATENCY_SLO", "10"))
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend that is currently failing."""
+
+class CircuitBreaker:
+    """Trip after consecutive failures or SLO breaches, then probe with one call at a time."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, slow_threshold=BREAKER_SLOW_THRESHOLD,
+                 reset_timeout=BREAKER_RESET_TIMEOUT, latency_slo=LLM_LATENCY_SLO):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_threshold = slow_threshold
+        self.reset_timeout = reset_timeout
+        self.latency_slo = latency_slo
+        self.state = self.CLOSED
+        self.failures = 0
+        self.slow_calls = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.time() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenError(f"{self.name} circuit is open")
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                # Only one probe at a time; everyone else keeps using the fallbacks
+                if self._probe_in_flight:
+                    raise CircuitOpenError(f"{self.name} circuit is half-open")
+                self._probe_in_flight = True
+
+    def record_success(self, latency):
+        with self._lock:
+            self._probe_in_flight = False
+            self.failures = 0
+            if latency > self.latency_slo:
+                self.slow_calls += 1
+                if self.state == self.HALF_OPEN or self.slow_calls >= self.slow_threshold:
+                    self._trip(f"{self.slow_calls} calls slower than {self.latency_slo}s")
+                return
+            self.slow_calls = 0
+            if self.state != self.CLOSED:
+                logging.info(f"{self.name} circuit closed")
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._probe_in_flight = False
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._trip(f"{self.failures} consecutive failures")
+
+    def _trip(self, reason):
+        if self.state != self.OPEN:
+            logging.error(f"{self.name} circuit opened after {reason}")
+        self.state = self.OPEN
+        self.opened_at = time.time()
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'consecutive_slow_calls': self.slow_calls,
+        }
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import os
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from sqlalchemy.exc import IntegrityError
+
+from metrics import llm_requests, llm_tokens
+from utils import LazyEngine
+
+# Daily LLM token budgets (0 disables a budget)
+USER_DAILY_TOKEN_BUDGET = int(os.environ.get("USER_DAILY_TOKEN_BUDGET", "0"))
+GLOBAL_DAILY_TOKEN_BUDGET = int(os.environ.get("GLOBAL_DAILY_TOKEN_BUDGET", "0"))
+
+# Meter of the request or job currently spending tokens
+_current_meter = ContextVar("usage_meter", default=None)
+
+class UsageMeter:
+    """Token usage of one request or job, per model."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.models = {}
+        self._lock = threading.Lock()
+
+    def add(self, completion):
+        with self._lock:
+            prompt_tokens, completion_tokens, requests = self.models.get(completion.model, (0, 0, 0))
+            self.models[completion.model] = (
+                prompt_tokens + completion.prompt_tokens,
+                completion_tokens + completion.completion_tokens,
+                requests + 1
+            )
+
+    @property
+    def total_tokens(self):
+        return sum(prompt + completion for prompt, completion, _ in self.models.values())
+
+def record_usage(completion):
+    """Count a finished completion process-wide and charge it to the active meter, if any."""
+    llm_tokens.inc(completion.prompt_tokens, model=completion.model, kind="prompt")
+    llm_tokens.inc(completion.completion_tokens, model=completion.model, kind="completion")
+    llm_requests.inc(model=completion.model)
+    meter = _current_meter.get()
+    if meter is not None:
+        meter.add(completion)
+
+def today():
+    return datetime.now(timezone.utc).date()
+
+class TokenBudget(LazyEngine):
+    """Daily token accounting and budget checks backed by the TokenUsage table."""
+
+    def __init__(self, user_budget=USER_DAILY_TOKEN_BUDGET, global_budget=GLOBAL_DAILY_TOKEN_BUDGET):
+        self.user_budget = user_budget
+        self.global_budget = global_budget
+        self.app = None
+        self.db = None
+        self.model = None
+
+    def init_app(self, app, db, model):
+        """Attach the usage table."""
+        self.app = app
+        self.db = db
+        self.model = model
+
+    @contextmanager
+    def meter(self, user_id):
+        """Meter every LLM call made inside the block and store the totals on exit."""
+        meter = UsageMeter(user_id)
+        token = _current_meter.set(meter)
+        try:
+            yield meter
+        finally:
+            _current_meter.reset(token)
+            self.save(meter)
+
+    @asynccontextmanager
+    async def ameter(self, user_id):
+        """Async meter(); tasks started inside the block inherit it, and the totals are stored from a thread."""
+        meter = UsageMeter(user_id)
+        token = _current_meter.set(meter)
+        try:
+            yield meter
+        finally:
+            _current_meter.reset(token)
+            await asyncio.to_thread(self.save, meter)
+
+    def save(self, meter):
+        """Add a meter's totals to today's usage rows."""
+        if self.db is None or not meter.models:
+            return
+        table = self.model.__table__
+        day = today()
+        try:
+            for model_name, (prompt_tokens, completion_tokens, requests) in meter.models.items():
+                match = (table.c.user_id == meter.user_id, table.c.day == day, table.c.model == model_name)
+                values = dict(
+                    prompt_tokens=table.c.prompt_tokens + prompt_tokens,
+                    completion_tokens=table.c.completion_tokens + completion_tokens,
+                    requests=table.c.requests + requests
+                )
+                with self.engine.begin() as conn:
+                    if conn.execute(table.update().where(*match).values(**values)).rowcount:
+                        continue
+                try:
+                    with self.engine.begin() as conn:
+                        conn.execute(table.insert().values(
+                            user_id=meter.user_id,
+                            day=day,
+                            model=model_name,
+                            prompt_tokens=prompt_tokens,
+                            completion_tokens=completion_tokens,
+                            requests=requests
+                        ))
+                except IntegrityError:
+                    # A concurrent request created today's row first
+                    with self.engine.begin() as conn:
+                        conn.execute(table.update().where(*match).values(**values))
+        except Exception as e:
+            logging.error(f"Token usage write failed: {str(e)}")
+
+    def used_today(self, user_id=None):
+        """Tokens spent today by one user, or by everyone when user_id is None."""
+        table = self.model.__table__
+        query = self.db.select(
+            self.db.func.coalesce(self.db.func.sum(table.c.prompt_tokens + table.c.completion_tokens), 0)
+        ).where(table.c.day == today())
+        if user_id is not None:
+            query = query.where(table.c.user_id == user_id)
+        with self.engine.connect() as conn:
+            return conn.execute(query).scalar()
+
+    def allows(self, user_id):
+        """Whether the user may spend more LLM tokens today."""
+        if self.db is None:
+            return True
+        try:
+            if self.user_budget and self.used_today(user_id) >= self.user_budget:
+                return False
+            if self.global_budget and self.used_today() >= self.global_budget:
+                return False
+        except Exception as e:
+            logging.error(f"Token budget check failed: {str(e)}")
+        return True
+
+    def engine_for(self, user_id, engine):
+        """Degrade AI requests to the local extractive engine once a budget is spent."""
+        if engine == "ai" and not self.allows(user_id):
+            return "extractive"
+        return engine
+
+# Shared token budget
+token_budget = TokenBudget()
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from utils import LazyEngine
+
+# Cache configuration
+SUMMARY_CACHE_SIZE = int(os.environ.get("SUMMARY_CACHE_SIZE", "256"))
+SUMMARY_CACHE_TTL = int(os.environ.get("SUMMARY_CACHE_TTL", str(7 * 24 * 3600)))
+SUMMARY_CACHE_DB_MAX_ROWS = int(os.environ.get("SUMMARY_CACHE_DB_MAX_ROWS", "10000"))
+
+def make_cache_key(text, length="medium", reading_level="medium", interests=None, engine="ai"):
+    """Build a content-addressed cache key for a summary request."""
+    # Interests are order- and case-insensitive for the purpose of caching
+    normalized_interests = sorted({i.strip().lower() for i in (interests or []) if i and i.strip()})
+    payload = json.dumps([text, length, reading_level, normalized_interests, engine], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with an optional TTL."""
+
+    def __init__(self, max_size=256, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class SummaryCache(LazyEngine):
+    """Two-tier summary cache: in-process LRU in front of a shared database table."""
+
+    def __init__(self, max_size=SUMMARY_CACHE_SIZE, ttl=SUMMARY_CACHE_TTL, db_max_rows=SUMMARY_CACHE_DB_MAX_ROWS):
+        self.ttl = ttl
+        self.db_max_rows = db_max_rows
+        self.memory = LRUCache(max_size=max_size, ttl=ttl)
+        self.app = None
+        self.db = None
+        self.model = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def init_app(self, app, db, model):
+        """Attach the shared database tier."""
+        self.app = app
+        self.db = db
+        self.model = model
+
+    def get(self, key):
+        """Return a cached summary result or None."""
+        value = self.memory.get(key)
+        if value is not None:
+            self._count('memory_hits')
+            return value
+
+        value = self._db_get(key)
+        if value is not None:
+            # Promote to the in-process tier
+            self.memory.set(key, value)
+            self._count('db_hits')
+            return value
+
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        """Store a summary result in both tiers."""
+        self.memory.set(key, value)
+        self._db_set(key, value)
+
+    def stats(self):
+        """Return hit/miss counters for both tiers."""
+        hits = self.memory_hits + self.db_hits
+        lookups = hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'db_hits': self.db_hits,
+            'misses': self.misses,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            'memory_entries': len(self.memory),
+        }
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _db_get(self, key):
+        if self.db is None:
+            return None
+        table = self.model.__table__
+        try:
+            # Use a dedicated connection so the request's session is never touched
+            with self.engine.connect() as conn:
+                row = conn.execute(
+                    table.select().where(table.c.cache_key == key)
+                ).first()
+            if row is None or row.expires_at < time.time():
+                return None
+            return {
+                'summary': row.summary,
+                'key_topics': json.loads(row.key_topics)
+            }
+        except Exception as e:
+            logging.error(f"Summary cache read failed: {str(e)}")
+            return None
+
+    def _db_set(self, key, value):
+        if self.db is None:
+            return
+        table = self.model.__table__
+        now = time.time()
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(table.delete().where(table.c.cache_key == key))
+                conn.execute(table.insert().values(
+                    cache_key=key,
+                    summary=value['summary'],
+                    key_topics=json.dumps(value['key_topics']),
+                    created_at=now,
+                    expires_at=now + self.ttl
+                ))
+            with self._lock:
+                self._writes += 1
+                should_evict = self._writes % 100 == 1
+            if should_evict:
+                self._evict_db(now)
+        except Exception as e:
+            logging.error(f"Summary cache write failed: {str(e)}")
+
+    def _evict_db(self, now):
+        """Drop expired rows and trim the table to its size bound."""
+        table = self.model.__table__
+        with self.engine.begin() as conn:
+            conn.execute(table.delete().where(table.c.expires_at < now))
+            cutoff = conn.execute(
+                self.db.select(table.c.created_at)
+                .order_by(table.c.created_at.desc())
+                .offset(self.db_max_rows)
+                .limit(1)
+            ).scalar()
+            if cutoff is not None:
+                conn.execute(table.delete().where(table.c.created_at <= cutoff))
+
+# Shared cache instance
+summary_cache = SummaryCache()
@@ -0,0 +1,96 @@
+import logging
+import os
+import re
+
+from cache import SummaryCache, make_cache_key
+
+# Chunking configuration
+CHUNK_TOKENS = int(os.environ.get("CHUNK_TOKENS", "1500"))
+MAX_INPUT_TOKENS = int(os.environ.get("MAX_INPUT_TOKENS", "3000"))
+
+# Approximates BPE tokenization when tiktoken is unavailable: short word pieces plus punctuation
+_APPROX_TOKEN_RE = re.compile(r"\w{1,4}|[^\w\s]")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+_encoding = None
+_encoding_loaded = False
+
+# Map-stage results are reused across lengths and reading levels
+chunk_cache = SummaryCache()
+
+def _get_encoding():
+    """Load the tiktoken encoding once, if tiktoken is installed."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logging.info(f"tiktoken unavailable, using approximate token counts: {str(e)}")
+    return _encoding
+
+def count_tokens(text):
+    """Count tokens locally, exactly with tiktoken or approximately without it."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(_APPROX_TOKEN_RE.findall(text))
+
+def truncate_to_tokens(text, max_tokens):
+    """Truncate text to at most max_tokens tokens."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens]) + "..."
+
+    matches = list(_APPROX_TOKEN_RE.finditer(text))
+    if len(matches) <= max_tokens:
+        return text
+    cut = matches[max_tokens].start()
+    # Prefer not to end in the middle of a word
+    space = text.rfind(" ", 0, cut)
+    if space > 0:
+        cut = space
+    return text[:cut].rstrip() + "..."
+
+def _split_units(text, max_tokens):
+    """Split text into sentence or word units that each fit max_tokens.
+    
+    Text arrives here after clean_text, which has already collapsed paragraph breaks into spaces.
+    """
+    units = []
+    for sentence in _SENTENCE_RE.split(text):
+        if not sentence:
+            continue
+        if count_tokens(sentence) <= max_tokens:
+            units.append(sentence)
+        else:
+            # A single oversized sentence is cut on word boundaries
+            words = sentence.split()
+            step = max(1, len(words) * max_tokens // count_tokens(sentence))
+            units.extend(" ".join(words[i:i + step]) for i in range(0, len(words), step))
+    return units
+
+def split_into_chunks(text, max_tokens=CHUNK_TOKENS):
+    """Split cleaned text into chunks of at most max_tokens, breaking on sentence boundaries."""
+    chunks = []
+    current = []
+    current_tokens = 0
+    for unit in _split_units(text, max_tokens):
+        unit_tokens = count_tokens(unit)
+        if current and current_tokens + unit_tokens > max_tokens:
+            chunks.append(" ".join(current))
+            current = []
+            current_tokens = 0
+        current.append(unit)
+        current_tokens += unit_tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+def make_chunk_key(chunk):
+    """Cache key for a chunk's map-stage summary."""
+    return make_cache_key(chunk, length="chunk", reading_level="chunk")
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+
+from utils import LazyEngine
+
+# Near-duplicate detection configuration
+MINHASH_PERMUTATIONS = int(os.environ.get("MINHASH_PERMUTATIONS", "128"))
+MINHASH_BANDS = int(os.environ.get("MINHASH_BANDS", "16"))
+SHINGLE_SIZE = int(os.environ.get("SHINGLE_SIZE", "5"))
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get("NEAR_DUPLICATE_THRESHOLD", "0.85"))
+NEAR_DUPLICATE_MAX_ROWS = int(os.environ.get("NEAR_DUPLICATE_MAX_ROWS", "50000"))
+
+# Shingle hashes permuted per step; bounds the (permutations x block) working matrix at a few MB
+MINHASH_BLOCK = 4096
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Universal hashing (a * x + b) mod p over 32-bit shingle hashes
+_PRIME = 4294967291
+_coefficients = None
+
+# NumPy is imported inside the functions below so it loads with the first fingerprint, not at app startup
+
+def hash_coefficients():
+    """Return the (a, b) coefficients of every permutation, built once."""
+    global _coefficients
+    if _coefficients is None:
+        import numpy as np
+        # A fixed seed keeps signatures comparable across processes and restarts
+        rng = np.random.default_rng(20240607)
+        a = rng.integers(1, 2 ** 31, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+        b = rng.integers(0, 2 ** 31, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+        _coefficients = (a, b)
+    return _coefficients
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """Hash every run of `size` consecutive words to a 32-bit integer."""
+    import numpy as np
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return None
+    # Repeated shingles are kept: they cannot change a minimum, and skipping the string set saves memory
+    count = len(words) - size + 1
+    return np.fromiter(
+        (zlib.crc32(' '.join(words[i:i + size]).encode('utf-8')) for i in range(count)),
+        dtype=np.uint64, count=count
+    )
+
+def minhash_signature(text):
+    """Return the MinHash signature of a text, or None if it is too short to fingerprint."""
+    hashes = shingle_hashes(text)
+    if hashes is None:
+        return None
+    import numpy as np
+    a, b = hash_coefficients()
+    signature = np.full(MINHASH_PERMUTATIONS, np.iinfo(np.uint64).max, dtype=np.uint64)
+    # One row per permutation; the running minimum over blocks of shingles is that permutation's value
+    for start in range(0, len(hashes), MINHASH_BLOCK):
+        block = hashes[start:start + MINHASH_BLOCK]
+        permuted = (np.outer(a, block) + b[:, None]) % np.uint64(_PRIME)
+        np.minimum(signature, permuted.min(axis=1), out=signature)
+    return signature.astype(np.uint32)
+
+def estimate_similarity(signature, other):
+    """Estimate the Jaccard similarity of two texts from their signatures."""
+    return float((signature == other).mean())
+
+def band_keys(signature, settings_key, bands=MINHASH_BANDS):
+    """LSH band keys; texts sharing any key are candidates for a full comparison."""
+    import numpy as np
+    keys = []
+    for index, band in enumerate(np.array_split(signature, bands)):
+        digest = hashlib.sha1(f"{settings_key}:{index}:".encode('utf-8') + band.tobytes()).hexdigest()
+        keys.append(digest)
+    return keys
+
+class NearDuplicateIndex(LazyEngine):
+    """MinHash/LSH index of summarized articles, keyed by the summary settings used."""
+
+    def __init__(self, threshold=NEAR_DUPLICATE_THRESHOLD, max_rows=NEAR_DUPLICATE_MAX_ROWS):
+        self.threshold = threshold
+        self.max_rows = max_rows
+        self.app = None
+        self.db = None
+        self.model = None
+        self.band_model = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app, db, model, band_model):
+        """Attach the fingerprint and band tables."""
+        self.app = app
+        self.db = db
+        self.model = model
+        self.band_model = band_model
+
+    def find(self, signature, settings_key):
+        """Return the stored result of the most similar article, or None."""
+        if self.db is None or signature is None:
+            return None
+        table = self.model.__table__
+        bands = self.band_model.__table__
+        try:
+            with self.engine.connect() as conn:
+                candidate_ids = self.db.select(bands.c.fingerprint_id).where(
+                    bands.c.band_key.in_(band_keys(signature, settings_key))
+                ).distinct()
+                rows = conn.execute(
+                    self.db.select(table.c.signature, table.c.summary, table.c.key_topics)
+                    .where(table.c.id.in_(candidate_ids))
+                    .where(table.c.settings_key == settings_key)
+                ).fetchall()
+        except Exception as e:
+            logging.error(f"Near-duplicate lookup failed: {str(e)}")
+            return None
+
+        import numpy as np
+        best, best_similarity = None, self.threshold
+        for row in rows:
+            similarity = estimate_similarity(signature, np.frombuffer(row.signature, dtype=np.uint32))
+            if similarity >= best_similarity:
+                best, best_similarity = row, similarity
+
+        if best is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return {'summary': best.summary, 'key_topics': json.loads(best.key_topics)}
+
+    def add(self, signature, settings_key, value):
+        """Index a freshly summarized article."""
+        if self.db is None or signature is None:
+            return
+        table = self.model.__table__
+        bands = self.band_model.__table__
+        now = time.time()
+        try:
+            with self.engine.begin() as conn:
+                fingerprint_id = conn.execute(table.insert().values(
+                    settings_key=settings_key,
+                    signature=signature.tobytes(),
+                    summary=value['summary'],
+                    key_topics=json.dumps(value['key_topics']),
+                    created_at=now
+                )).inserted_primary_key[0]
+                conn.execute(bands.insert(), [
+                    {'band_key': key, 'fingerprint_id': fingerprint_id}
+                    for key in band_keys(signature, settings_key)
+                ])
+            with self._lock:
+                self._writes += 1
+                should_evict = self._writes % 100 == 1
+            if should_evict:
+                self._evict()
+        except Exception as e:
+            logging.error(f"Near-duplicate index write failed: {str(e)}")
+
+    def stats(self):
+        """Return hit/miss counters."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _evict(self):
+        """Trim the index to its size bound, oldest fingerprints first."""
+        table = self.model.__table__
+        bands = self.band_model.__table__
+        with self.engine.begin() as conn:
+            cutoff = conn.execute(
+                self.db.select(table.c.id)
+                .order_by(table.c.id.desc())
+                .offset(self.max_rows)
+                .limit(1)
+            ).scalar()
+            if cutoff is not None:
+                conn.execute(bands.delete().where(bands.c.fingerprint_id <= cutoff))
+                conn.execute(table.delete().where(table.c.id <= cutoff))
+
+# Shared near-duplicate index
+near_duplicates = NearDuplicateIndex()
@@ -0,0 +1,89 @@
+import heapq
+import json
+import logging
+import math
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from interests import (
+    DIGEST_HALF_LIFE_HOURS, DIGEST_SIZE, DIGEST_USER_BATCH, DIGEST_WINDOW_HOURS, GENERAL,
+    digest_period, document_terms, interest_index
+)
+from main import app, db, Digest, FeedItem, User
+
+def build_story_index(items):
+    """Inverted index from term to [(item id, weight)]; key topics count most and rare terms more than common ones."""
+    index = defaultdict(dict)
+    for item in items:
+        for term in document_terms(item.summarized_text):
+            index[term][item.id] = 0.5
+        for term in document_terms(item.title):
+            index[term][item.id] = 1.0
+        for term in document_terms(*(item.key_topics or '').split(',')):
+            index[term][item.id] = 2.0
+
+    idf_base = len(items) + 1
+    return {
+        term: [(item_id, weight * math.log(idf_base / len(postings))) for item_id, weight in postings.items()]
+        for term, postings in index.items()
+    }
+
+def freshness(item, now):
+    """Exponential decay by story age."""
+    created = item.date_created if item.date_created.tzinfo else item.date_created.replace(tzinfo=timezone.utc)
+    age_hours = max(0.0, (now - created).total_seconds() / 3600)
+    return 0.5 ** (age_hours / DIGEST_HALF_LIFE_HOURS)
+
+def rank_for_user(terms, index, fresh):
+    """Top stories for one reader: summed term weights scaled by freshness."""
+    scores = defaultdict(float)
+    matched = defaultdict(list)
+    for term in terms:
+        for item_id, weight in index.get(term, ()):
+            scores[item_id] += weight
+            matched[item_id].append(term)
+    top = heapq.nlargest(DIGEST_SIZE, scores, key=lambda item_id: scores[item_id] * fresh[item_id])
+    return [[item_id, round(scores[item_id] * fresh[item_id], 4), sorted(matched[item_id])] for item_id in top]
+
+def build_digests(period=None):
+    """Materialize every user's ranked digest for a period. Returns the number of digests written."""
+    now = datetime.now(timezone.utc)
+    period = period or digest_period(now)
+
+    with app.app_context():
+        items = db.session.execute(
+            db.select(FeedItem)
+            .where(FeedItem.status == "done", FeedItem.date_created >= now - timedelta(hours=DIGEST_WINDOW_HOURS))
+        ).scalars().all()
+        index = build_story_index(items)
+        fresh = {item.id: freshness(item, now) for item in items}
+        # Readers of everything share one ranking by freshness
+        general_entries = [
+            [item_id, round(fresh[item_id], 4), []]
+            for item_id in heapq.nlargest(DIGEST_SIZE, fresh, key=fresh.get)
+        ]
+
+        table = Digest.__table__
+        max_user_id = db.session.execute(db.select(db.func.max(User.id))).scalar() or 0
+        written = 0
+        # Users are processed in id slices so memory stays bounded however many there are
+        for first_id in range(1, max_user_id + 1, DIGEST_USER_BATCH):
+            user_range = (first_id, first_id + DIGEST_USER_BATCH - 1)
+            rows = []
+            for user_id, terms in interest_index.users_for_terms(user_range=user_range).items():
+                entries = general_entries if GENERAL in terms else rank_for_user(terms, index, fresh)
+                rows.append({'user_id': user_id, 'period': period, 'entries': json.dumps(entries), 'created_at': time.time()})
+
+            with db.engine.begin() as conn:
+                conn.execute(table.delete().where(table.c.period == period, table.c.user_id.between(*user_range)))
+                if rows:
+                    conn.execute(table.insert(), rows)
+            written += len(rows)
+
+        logging.info(f"Built {written} digests for {period} from {len(items)} stories")
+        return written
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    build_digests()
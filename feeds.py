@@ -0,0 +1,339 @@
+import hashlib
+import logging
+import os
+import random
+import re
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin, urlparse
+
+from sqlalchemy import insert, update
+
+from articles import ArticleFetchError, http_get, normalize_url
+from batch import run_batch
+from interests import document_terms, interest_index
+from main import app, db, Feed, FeedItem, FeedDelivery, generate_summary, extract_article_from_url
+
+# Feed polling configuration (seconds)
+FEED_POLL_INTERVAL = int(os.environ.get("FEED_POLL_INTERVAL", "900"))
+FEED_MAX_BACKOFF = int(os.environ.get("FEED_MAX_BACKOFF", str(6 * 3600)))
+FEED_POLL_LEASE = int(os.environ.get("FEED_POLL_LEASE", "300"))
+FEED_SCHEDULER_TICK = float(os.environ.get("FEED_SCHEDULER_TICK", "30"))
+FEED_POLL_BATCH = int(os.environ.get("FEED_POLL_BATCH", "50"))
+FEED_MAX_ITEMS = int(os.environ.get("FEED_MAX_ITEMS", "50"))
+
+# Every feed item is summarized once with these settings and shared by all matching users
+FEED_SUMMARY_LENGTH = os.environ.get("FEED_SUMMARY_LENGTH", "medium")
+FEED_SUMMARY_ENGINE = os.environ.get("FEED_SUMMARY_ENGINE", "ai")
+# Feed descriptions at least this long are summarized when the article itself cannot be fetched
+FEED_MIN_TEXT_CHARS = int(os.environ.get("FEED_MIN_TEXT_CHARS", "300"))
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+RSS1 = '{http://purl.org/rss/1.0/}'
+CONTENT_ENCODED = '{http://purl.org/rss/1.0/modules/content/}encoded'
+
+_TAG_RE = re.compile(r'<[^>]*>')
+
+def strip_html(value):
+    return re.sub(r'\s+', ' ', _TAG_RE.sub(' ', value or '')).strip()
+
+def parse_date(value):
+    """Parse RFC 822 (RSS) or ISO 8601 (Atom) dates; None if unparseable."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def _find_text(element, *paths):
+    for path in paths:
+        found = element.find(path)
+        if found is not None and found.text and found.text.strip():
+            return found.text.strip()
+    return None
+
+def _atom_link(entry, base_url):
+    for link in entry.findall(f'{ATOM}link'):
+        if link.get('rel', 'alternate') == 'alternate' and link.get('href'):
+            return urljoin(base_url, link.get('href'))
+    return None
+
+def parse_feed(body, base_url):
+    """Parse an RSS 2.0, RSS 1.0 or Atom document into (title, entries)."""
+    root = ET.fromstring(body)
+    entries = []
+
+    if root.tag == f'{ATOM}feed':
+        title = _find_text(root, f'{ATOM}title')
+        for entry in root.findall(f'{ATOM}entry'):
+            entries.append({
+                'guid': _find_text(entry, f'{ATOM}id'),
+                'url': _atom_link(entry, base_url),
+                'title': _find_text(entry, f'{ATOM}title'),
+                'description': _find_text(entry, f'{ATOM}content', f'{ATOM}summary'),
+                'published_at': parse_date(_find_text(entry, f'{ATOM}published', f'{ATOM}updated'))
+            })
+    else:
+        channel = root.find('channel')
+        if channel is None:
+            channel = root.find(f'{RSS1}channel')
+        title = _find_text(channel, 'title', f'{RSS1}title') if channel is not None else None
+        # RSS 2.0 nests items in the channel, RSS 1.0 places them next to it
+        items = root.findall('channel/item') or root.findall(f'{RSS1}item')
+        for item in items:
+            link = _find_text(item, 'link', f'{RSS1}link')
+            entries.append({
+                'guid': _find_text(item, 'guid'),
+                'url': urljoin(base_url, link) if link else None,
+                'title': _find_text(item, 'title', f'{RSS1}title'),
+                'description': _find_text(item, CONTENT_ENCODED, 'description', f'{RSS1}description'),
+                'published_at': parse_date(_find_text(item, 'pubDate', '{http://purl.org/dc/elements/1.1/}date'))
+            })
+
+    for entry in entries:
+        if entry['url']:
+            # Links are shown to every subscriber, so only web links are kept
+            entry['url'] = normalize_url(entry['url']) if urlparse(entry['url']).scheme in ('http', 'https') else None
+        # Items without a GUID are identified by their link, or failing that their content
+        if not entry['guid']:
+            entry['guid'] = entry['url'] or hashlib.sha1(
+                f"{entry['title']}|{entry['description']}".encode('utf-8')
+            ).hexdigest()
+    return title, entries
+
+def backoff_delay(failures):
+    """Seconds until the next poll: the regular interval, doubled per consecutive failure, with jitter."""
+    return min(FEED_MAX_BACKOFF, FEED_POLL_INTERVAL * 2 ** failures) * random.uniform(0.9, 1.1)
+
+def claim_due_feeds(now):
+    """Lease feeds whose next poll is due so concurrent schedulers skip them."""
+    due = db.session.execute(
+        db.select(Feed.id, Feed.next_poll_at)
+        .where(Feed.next_poll_at <= now)
+        .order_by(Feed.next_poll_at)
+        .limit(FEED_POLL_BATCH)
+    ).all()
+
+    claimed = []
+    for feed_id, next_poll_at in due:
+        result = db.session.execute(
+            update(Feed)
+            .where(Feed.id == feed_id, Feed.next_poll_at == next_poll_at)
+            .values(next_poll_at=now + FEED_POLL_LEASE)
+        )
+        if result.rowcount == 1:
+            claimed.append(feed_id)
+    db.session.commit()
+    return claimed
+
+def store_items(feed, entries):
+    """Insert entries not seen before, by GUID within the feed or by URL across all feeds."""
+    entries = [entry for entry in entries if entry['title'] or entry['url']][:FEED_MAX_ITEMS]
+    if not entries:
+        return 0
+
+    known_guids = set(db.session.execute(
+        db.select(FeedItem.guid).where(FeedItem.feed_id == feed.id, FeedItem.guid.in_([e['guid'] for e in entries]))
+    ).scalars())
+    urls = [entry['url'] for entry in entries if entry['url']]
+    known_urls = set(db.session.execute(
+        db.select(FeedItem.url).where(FeedItem.url.in_(urls))
+    ).scalars()) if urls else set()
+
+    new_items = []
+    for entry in entries:
+        if entry['guid'] in known_guids or (entry['url'] and entry['url'] in known_urls):
+            continue
+        known_guids.add(entry['guid'])
+        if entry['url']:
+            known_urls.add(entry['url'])
+        new_items.append(FeedItem(
+            feed_id=feed.id,
+            guid=entry['guid'][:500],
+            url=entry['url'],
+            title=(entry['title'] or entry['url'])[:200],
+            description=entry['description'],
+            published_at=entry['published_at']
+        ))
+    db.session.add_all(new_items)
+    return len(new_items)
+
+def fetch_feed(entry, host_slot):
+    """Download and parse one feed with a conditional GET. Runs on a pool thread without the database."""
+    headers = {}
+    if entry['etag']:
+        headers['If-None-Match'] = entry['etag']
+    if entry['last_modified']:
+        headers['If-Modified-Since'] = entry['last_modified']
+
+    try:
+        with host_slot:
+            status, body, response_headers, final_url = http_get(entry['url'], headers)
+        if status == 304:
+            return {'status': 304}
+        if status != 200:
+            raise ArticleFetchError(f"Feed returned HTTP {status}")
+        title, entries = parse_feed(body, final_url)
+        return {
+            'status': 200,
+            'title': title,
+            'entries': entries,
+            'etag': response_headers.get('ETag'),
+            'last_modified': response_headers.get('Last-Modified')
+        }
+    except Exception as e:
+        return {'status': None, 'error': str(e)}
+
+def apply_poll(feed_id, result, now):
+    """Store a poll result and schedule the feed's next poll."""
+    feed = db.session.get(Feed, feed_id)
+    feed.last_polled_at = now
+    new_items = 0
+    if result['status'] is None:
+        logging.error(f"Polling feed {feed_id} failed: {result['error']}")
+        feed.failures += 1
+        feed.last_error = result['error']
+    else:
+        if result['status'] == 200:
+            new_items = store_items(feed, result['entries'])
+            feed.title = feed.title or (result['title'] or '')[:200] or None
+            feed.etag = result['etag']
+            feed.last_modified = result['last_modified']
+        feed.failures = 0
+        feed.last_error = None
+    feed.next_poll_at = now + backoff_delay(feed.failures)
+    db.session.commit()
+    return new_items
+
+def claim_new_items(limit=FEED_POLL_BATCH):
+    """Move new items to processing and return their ids."""
+    candidates = db.session.execute(
+        db.select(FeedItem.id).where(FeedItem.status == "new").order_by(FeedItem.id).limit(limit)
+    ).scalars().all()
+
+    claimed = []
+    for item_id in candidates:
+        result = db.session.execute(
+            update(FeedItem).where(FeedItem.id == item_id, FeedItem.status == "new").values(status="processing")
+        )
+        if result.rowcount == 1:
+            claimed.append(item_id)
+    db.session.commit()
+    return claimed
+
+def summarize_item(item_id, host_slot):
+    """Summarize one feed item with the shared feed settings; host_slot is held only while downloading."""
+    item = db.session.get(FeedItem, item_id)
+    text = None
+    if item.url:
+        with host_slot:
+            article, error = extract_article_from_url(item.url)
+        if article:
+            text = article['text']
+        else:
+            logging.info(f"Feed item {item_id} falls back to its description: {error}")
+    if not text:
+        description = strip_html(item.description)
+        if len(description) >= FEED_MIN_TEXT_CHARS:
+            text = description
+
+    if not text:
+        item.status = "failed"
+        db.session.commit()
+        return False
+
+    # No interests: highlights are applied per reader when the item is shown
+    summary_result = generate_summary(
+        text,
+        length=FEED_SUMMARY_LENGTH,
+        reading_level="medium",
+        interests=None,
+        engine=FEED_SUMMARY_ENGINE
+    )
+    item.summarized_text = summary_result['summary']
+    item.key_topics = ','.join(summary_result['key_topics'])
+    item.status = "done"
+    db.session.commit()
+    return True
+
+def fan_out(item_ids):
+    """Deliver summarized items to every user whose interests they match."""
+    items = db.session.execute(
+        db.select(FeedItem).where(FeedItem.id.in_(item_ids), FeedItem.status == "done")
+    ).scalars().all()
+
+    rows = []
+    for item in items:
+        # One indexed lookup per story instead of testing every user's interests
+        terms = document_terms(item.title, item.summarized_text, *(item.key_topics or '').split(','))
+        rows.extend({'user_id': user_id, 'item_id': item.id} for user_id in interest_index.users_for_terms(terms))
+
+    if rows:
+        db.session.execute(insert(FeedDelivery), rows)
+    db.session.commit()
+    return len(rows)
+
+def _in_context(task):
+    """Run a per-item task on a pool thread with its own app context and session."""
+    def run(entry, host_slot):
+        with app.app_context():
+            try:
+                return {'ok': task(entry['id'], host_slot)}
+            except Exception as e:
+                logging.error(f"Feed task for {entry['id']} failed: {str(e)}")
+                db.session.rollback()
+                return {'ok': False}
+            finally:
+                db.session.remove()
+    return run
+
+def run_once():
+    """Poll due feeds, summarize their new items once and deliver them."""
+    with app.app_context():
+        feeds = []
+        for feed_id in claim_due_feeds(time.time()):
+            feed = db.session.get(Feed, feed_id)
+            feeds.append({'id': feed.id, 'url': feed.url, 'etag': feed.etag, 'last_modified': feed.last_modified})
+
+        # Downloads run concurrently, throttled per host by run_batch; items are stored one feed
+        # at a time so a story syndicated in several feeds is only kept once
+        for index, result in run_batch(feeds, fetch_feed):
+            apply_poll(feeds[index]['id'], result, time.time())
+
+        item_ids = claim_new_items()
+        items = [{'id': item_id, 'url': db.session.get(FeedItem, item_id).url} for item_id in item_ids]
+        summarized = [items[index]['id'] for index, result in run_batch(items, _in_context(summarize_item)) if result['ok']]
+
+        # Items whose task raised are not retried on every pass
+        db.session.execute(
+            update(FeedItem).where(FeedItem.id.in_(item_ids), FeedItem.status == "processing").values(status="failed")
+        )
+        db.session.commit()
+
+        deliveries = fan_out(summarized)
+        logging.info(f"Polled {len(feeds)} feeds, summarized {len(summarized)} items, made {deliveries} deliveries")
+        return len(summarized)
+
+def run_scheduler():
+    """Poll feeds every FEED_SCHEDULER_TICK seconds until interrupted."""
+    try:
+        while True:
+            try:
+                run_once()
+            except Exception as e:
+                logging.error(f"Feed scheduler pass failed: {str(e)}")
+            time.sleep(FEED_SCHEDULER_TICK)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_scheduler()
@@ -0,0 +1,20 @@
+import os
+
+# Gunicorn picks this file up automatically when started from the project root
+
+# Load the app once in the master so every worker shares its imported modules copy-on-write
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+# Import heavy dependencies before serving rather than on the first request (WARM_UP=0 keeps them lazy)
+warm_up = os.environ.get("WARM_UP", "1") == "1"
+
+def when_ready(server):
+    # With preload the app is already imported here; warming it in the master shares the result with every worker
+    if preload_app and warm_up:
+        from main import warm_up as warm_up_app
+        warm_up_app()
+
+def post_worker_init(worker):
+    # Without preload each worker warms itself before accepting requests (a no-op after the master did it)
+    if warm_up:
+        from main import warm_up as warm_up_app
+        warm_up_app()
@@ -0,0 +1,41 @@
+import os
+import re
+from functools import lru_cache
+
+# Number of distinct interest sets whose compiled patterns are kept
+HIGHLIGHT_PATTERN_CACHE_SIZE = int(os.environ.get("HIGHLIGHT_PATTERN_CACHE_SIZE", "1024"))
+
+HIGHLIGHT_OPEN = '<span class="interest-highlight">'
+HIGHLIGHT_CLOSE = '</span>'
+
+def normalize_interests(interests):
+    """Return a hashable, order-independent key for an interest list."""
+    return tuple(sorted({interest.strip().lower() for interest in (interests or []) if interest and interest.strip()}))
+
+@lru_cache(maxsize=HIGHLIGHT_PATTERN_CACHE_SIZE)
+def compile_highlighter(interest_key):
+    """Compile one alternation pattern for a normalized interest set."""
+    if not interest_key:
+        return None
+    # Longest first so multi-word interests win over their prefixes
+    terms = sorted(interest_key, key=len, reverse=True)
+    alternation = '|'.join(re.escape(term) for term in terms)
+    # Existing highlights, other tags and character references are matched first and passed through untouched
+    return re.compile(
+        r'(?P<skip>' + re.escape(HIGHLIGHT_OPEN) + r'.*?' + re.escape(HIGHLIGHT_CLOSE) + r'|<[^>]*>|&#?\w+;)'
+        r'|\b(?P<term>' + alternation + r')\b',
+        re.IGNORECASE | re.DOTALL
+    )
+
+def _replace(match):
+    if match.group('skip') is not None:
+        return match.group('skip')
+    # Keep the casing used in the summary itself
+    return HIGHLIGHT_OPEN + match.group('term') + HIGHLIGHT_CLOSE
+
+def highlight_interests(summary_text, interests):
+    """Wrap occurrences of the user's interests in highlight spans in a single pass."""
+    pattern = compile_highlighter(normalize_interests(interests))
+    if pattern is None or not summary_text:
+        return summary_text
+    return pattern.sub(_replace, summary_text)
@@ -0,0 +1,104 @@
+import os
+import re
+from datetime import datetime, timezone
+
+from sqlalchemy import event, inspect
+
+from highlight import normalize_interests
+from utils import LazyEngine
+
+_WORD_RE = re.compile(r'[a-z0-9][a-z0-9\-]*')
+_TAG_RE = re.compile(r'<[^>]*>')
+
+# Readers with this interest receive every story
+GENERAL = "general"
+
+# Digest configuration
+DIGEST_SIZE = int(os.environ.get("DIGEST_SIZE", "10"))
+DIGEST_WINDOW_HOURS = float(os.environ.get("DIGEST_WINDOW_HOURS", "24"))
+DIGEST_HALF_LIFE_HOURS = float(os.environ.get("DIGEST_HALF_LIFE_HOURS", "12"))
+DIGEST_USER_BATCH = int(os.environ.get("DIGEST_USER_BATCH", "5000"))
+
+def digest_period(now=None):
+    """Key of the daily digest period containing `now` (UTC)."""
+    return (now or datetime.now(timezone.utc)).date().isoformat()
+
+def interest_terms(interests):
+    """Normalized terms of a comma-separated User.interests string."""
+    return normalize_interests((interests or GENERAL).split(','))
+
+def document_terms(*texts):
+    """Words and two-word phrases of a story, in the same normalized form as interest terms."""
+    terms = set()
+    for text in texts:
+        words = _WORD_RE.findall(_TAG_RE.sub(' ', text or '').lower())
+        terms.update(words)
+        terms.update(f"{first} {second}" for first, second in zip(words, words[1:]))
+    return terms
+
+class InterestIndex(LazyEngine):
+    """Inverted index from interest term to users, kept in sync with User.interests."""
+
+    def __init__(self):
+        self.app = None
+        self.db = None
+        self.model = None
+
+    def init_app(self, app, db, model, user_model):
+        """Attach the user-interest table and maintain it on every user write."""
+        self.app = app
+        self.db = db
+        self.model = model
+        event.listen(user_model, 'after_insert', self._index_user)
+        event.listen(user_model, 'after_update', self._reindex_user)
+
+    def _index_user(self, mapper, connection, target):
+        self.sync(connection, target.id, target.interests)
+
+    def _reindex_user(self, mapper, connection, target):
+        if inspect(target).attrs.interests.history.has_changes():
+            self.sync(connection, target.id, target.interests)
+
+    def sync(self, conn, user_id, interests):
+        """Replace a user's rows with the terms of their interests string."""
+        table = self.model.__table__
+        conn.execute(table.delete().where(table.c.user_id == user_id))
+        rows = [{'user_id': user_id, 'term': term} for term in interest_terms(interests)]
+        if rows:
+            conn.execute(table.insert(), rows)
+
+    def backfill(self, user_model):
+        """Index users created before the table existed. Call inside an app context."""
+        table = self.model.__table__
+        users = user_model.__table__
+        with self.engine.begin() as conn:
+            if conn.execute(self.db.select(table.c.user_id).limit(1)).first() is not None:
+                return
+            rows = [
+                {'user_id': user_id, 'term': term}
+                for user_id, interests in conn.execute(self.db.select(users.c.id, users.c.interests))
+                for term in interest_terms(interests)
+            ]
+            if rows:
+                conn.execute(table.insert(), rows)
+
+    def users_for_terms(self, terms=None, user_range=None):
+        """Map user id to the subset of terms they follow, including readers of everything.
+
+        terms=None returns every term; user_range=(first_id, last_id) limits the lookup to a slice of users.
+        """
+        table = self.model.__table__
+        query = self.db.select(table.c.user_id, table.c.term)
+        if terms is not None:
+            query = query.where(table.c.term.in_(set(terms) | {GENERAL}))
+        if user_range is not None:
+            query = query.where(table.c.user_id.between(*user_range))
+
+        matches = {}
+        with self.engine.connect() as conn:
+            for user_id, term in conn.execute(query):
+                matches.setdefault(user_id, set()).add(term)
+        return matches
+
+# Shared interest index
+interest_index = InterestIndex()
@@ -0,0 +1,411 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+
+from breaker import CircuitBreaker
+from budget import record_usage
+from chunking import count_tokens
+
+# LLM backend configuration: "openai", "local" (any OpenAI-compatible server) or "fake"
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "openai")
+LLM_MODEL = os.environ.get("LLM_MODEL", "gpt-4o")  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
+
+# Route summary lengths to different models, e.g. brief summaries to a faster one
+LLM_MODEL_ROUTES = {
+    "brief": os.environ.get("LLM_MODEL_BRIEF", LLM_MODEL),
+    "medium": os.environ.get("LLM_MODEL_MEDIUM", LLM_MODEL),
+    "detailed": os.environ.get("LLM_MODEL_DETAILED", LLM_MODEL),
+}
+
+# HTTP pooling, timeouts and retries (seconds)
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "30"))
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", "8"))
+
+# Local OpenAI-compatible server (llama.cpp, vLLM, Ollama, ...)
+LLM_LOCAL_URL = os.environ.get("LLM_LOCAL_URL", "http://localhost:8080/v1")
+LLM_LOCAL_MODEL = os.environ.get("LLM_LOCAL_MODEL", "local")
+LLM_LOCAL_JSON_MODE = os.environ.get("LLM_LOCAL_JSON_MODE", "1") == "1"
+
+# Hedged requests: fire a second attempt when the first outlives the recent p95 latency
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_DELAY = float(os.environ.get("LLM_HEDGE_DELAY", "2"))
+LLM_HEDGE_MIN_DELAY = float(os.environ.get("LLM_HEDGE_MIN_DELAY", "0.25"))
+
+# Simulated per-call latency of the fake backend, in milliseconds
+LLM_FAKE_LATENCY_MS = float(os.environ.get("LLM_FAKE_LATENCY_MS", "0"))
+
+def model_for(length=None):
+    """Return the model configured for a summary length."""
+    return LLM_MODEL_ROUTES.get(length, LLM_MODEL)
+
+class Completion:
+    """Text of a finished completion plus its token usage."""
+
+    def __init__(self, text, model, prompt_tokens=0, completion_tokens=0):
+        self.text = text
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+class OpenAIBackend:
+    """OpenAI chat completions over one pooled HTTP client, with jittered retries."""
+
+    name = "openai"
+    json_mode = True
+    # Ask for a final usage chunk on streams (not every compatible server supports it)
+    stream_usage = True
+
+    def __init__(self, api_key=None, base_url=None, default_model=LLM_MODEL, max_retries=LLM_MAX_RETRIES):
+        # Import here so the OpenAI SDK and httpx load only when a real backend is used
+        import httpx
+        from openai import OpenAI, APIConnectionError, InternalServerError, RateLimitError
+
+        self.default_model = default_model
+        self.max_retries = max_retries
+        self.retryable = (APIConnectionError, InternalServerError, RateLimitError)
+        self.api_key = api_key
+        self.base_url = base_url
+        http_client = httpx.Client(
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+        )
+        # Retries are handled here so every attempt shares the same backoff policy
+        self.client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+        self._async_client = None
+
+    @property
+    def async_client(self):
+        """AsyncOpenAI client for the ASGI entry point, created on first use inside its event loop."""
+        if self._async_client is None:
+            import httpx
+            from openai import AsyncOpenAI
+
+            http_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+            )
+            self._async_client = AsyncOpenAI(
+                api_key=self.api_key, base_url=self.base_url, http_client=http_client, max_retries=0
+            )
+        return self._async_client
+
+    def _params(self, prompt, max_tokens, temperature, json_mode, model, **extra):
+        params = {
+            "model": model or self.default_model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+        }
+        if temperature is not None:
+            params["temperature"] = temperature
+        if json_mode and self.json_mode:
+            params["response_format"] = {"type": "json_object"}
+        params.update(extra)
+        return params
+
+    def _backoff(self, attempt, error):
+        # Full jitter keeps concurrent workers from retrying in lockstep
+        delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+        logging.warning(f"LLM call failed ({str(error)}), retrying in {delay:.2f}s")
+        return delay
+
+    def _request(self, prompt, max_tokens, temperature, json_mode, model, **extra):
+        params = self._params(prompt, max_tokens, temperature, json_mode, model, **extra)
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.client.chat.completions.create(**params)
+            except self.retryable as e:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._backoff(attempt, e))
+
+    async def _arequest(self, prompt, max_tokens, temperature, json_mode, model):
+        params = self._params(prompt, max_tokens, temperature, json_mode, model)
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self.async_client.chat.completions.create(**params)
+            except self.retryable as e:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
+
+    def complete(self, prompt, max_tokens, temperature=None, json_mode=False, model=None):
+        """Run one completion and return its text and usage."""
+        response = self._request(prompt, max_tokens, temperature, json_mode, model)
+        return self._completion(prompt, response)
+
+    async def acomplete(self, prompt, max_tokens, temperature=None, json_mode=False, model=None):
+        """Async complete() without blocking the event loop."""
+        response = await self._arequest(prompt, max_tokens, temperature, json_mode, model)
+        return self._completion(prompt, response)
+
+    def _completion(self, prompt, response):
+        text = response.choices[0].message.content or ""
+        usage = response.usage
+        completion = Completion(
+            text,
+            response.model,
+            usage.prompt_tokens if usage else count_tokens(prompt),
+            usage.completion_tokens if usage else count_tokens(text)
+        )
+        record_usage(completion)
+        return completion
+
+    def stream(self, prompt, max_tokens, temperature=None, model=None):
+        """Yield completion text fragments as they are generated."""
+        extra = {"stream_options": {"include_usage": True}} if self.stream_usage else {}
+        stream = self._request(prompt, max_tokens, temperature, False, model, stream=True, **extra)
+        parts, usage, model_name = [], None, model or self.default_model
+        for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+            model_name = chunk.model or model_name
+
+        # Servers that do not report stream usage are charged a local estimate
+        if usage is not None:
+            record_usage(Completion("".join(parts), model_name, usage.prompt_tokens, usage.completion_tokens))
+        else:
+            text = "".join(parts)
+            record_usage(Completion(text, model_name, count_tokens(prompt), count_tokens(text)))
+
+class LocalBackend(OpenAIBackend):
+    """Self-hosted model behind an OpenAI-compatible endpoint."""
+
+    name = "local"
+    json_mode = LLM_LOCAL_JSON_MODE
+    stream_usage = False
+
+    def __init__(self):
+        super().__init__(api_key="local", base_url=LLM_LOCAL_URL, default_model=LLM_LOCAL_MODEL)
+
+    def complete(self, prompt, max_tokens, temperature=None, json_mode=False, model=None):
+        # Routed OpenAI model names mean nothing to a local server
+        return super().complete(prompt, max_tokens, temperature, json_mode, self.default_model)
+
+    async def acomplete(self, prompt, max_tokens, temperature=None, json_mode=False, model=None):
+        return await super().acomplete(prompt, max_tokens, temperature, json_mode, self.default_model)
+
+    def stream(self, prompt, max_tokens, temperature=None, model=None):
+        return super().stream(prompt, max_tokens, temperature, self.default_model)
+
+_FAKE_SOURCE_RE = re.compile(r'(?:TEXT TO SUMMARIZE|TEXT|SECTION):\s*(.*?)\s*(?:KEY TOPICS[^\n]*)?$', re.DOTALL)
+_FAKE_WORD_RE = re.compile(r'[A-Za-z][A-Za-z\-]{4,}')
+
+class FakeBackend:
+    """Deterministic offline stand-in for benchmarks and development."""
+
+    name = "fake"
+
+    def __init__(self, latency_ms=LLM_FAKE_LATENCY_MS):
+        self.latency = latency_ms / 1000.0
+
+    def _generate(self, prompt, max_tokens, json_mode):
+        match = _FAKE_SOURCE_RE.search(prompt)
+        source = match.group(1) if match else prompt
+        # Roughly three words per four tokens, never more than a short paragraph
+        summary = " ".join(source.split()[:min(80, max(1, max_tokens * 3 // 4))])
+        if not json_mode:
+            return summary
+        topics = [word for word, _ in Counter(w.lower() for w in _FAKE_WORD_RE.findall(source)).most_common(5)]
+        if '"summary"' in prompt:
+            return json.dumps({"summary": summary, "topics": topics})
+        return json.dumps({"topics": topics})
+
+    def complete(self, prompt, max_tokens, temperature=None, json_mode=False, model=None):
+        """Return a canned completion derived from the prompt."""
+        if self.latency:
+            time.sleep(self.latency)
+        text = self._generate(prompt, max_tokens, json_mode)
+        completion = Completion(text, model or "fake", count_tokens(prompt), count_tokens(text))
+        record_usage(completion)
+        return completion
+
+    async def acomplete(self, prompt, max_tokens, temperature=None, json_mode=False, model=None):
+        """Async complete(); the simulated latency does not block the event loop."""
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        text = self._generate(prompt, max_tokens, json_mode)
+        completion = Completion(text, model or "fake", count_tokens(prompt), count_tokens(text))
+        record_usage(completion)
+        return completion
+
+    def stream(self, prompt, max_tokens, temperature=None, model=None):
+        """Yield the canned completion word by word."""
+        if self.latency:
+            time.sleep(self.latency)
+        text = self._generate(prompt, max_tokens, False)
+        for index, word in enumerate(text.split()):
+            yield word if index == 0 else " " + word
+        record_usage(Completion(text, model or "fake", count_tokens(prompt), count_tokens(text)))
+
+class LatencyTracker:
+    """Rolling window of recent call latencies."""
+
+    def __init__(self, size=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, latency):
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, q):
+        """Return the q-quantile, or None until enough calls have been seen."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+class GuardedBackend:
+    """Wrap a backend with a shared circuit breaker and optional hedged completions."""
+
+    def __init__(self, backend, hedge=LLM_HEDGE):
+        self.backend = backend
+        self.name = backend.name
+        self.breaker = CircuitBreaker(f"llm:{backend.name}")
+        self.latencies = LatencyTracker()
+        self.hedge = hedge
+        self._pool = ThreadPoolExecutor(max_workers=LLM_MAX_CONNECTIONS) if hedge else None
+
+    def hedge_delay(self):
+        p95 = self.latencies.percentile(0.95)
+        return LLM_HEDGE_DELAY if p95 is None else max(LLM_HEDGE_MIN_DELAY, p95)
+
+    def complete(self, prompt, max_tokens, temperature=None, json_mode=False, model=None):
+        """Run a completion unless the circuit is open (raises CircuitOpenError)."""
+        self.breaker.before_call()
+        started = time.monotonic()
+        try:
+            if self.hedge:
+                completion = self._hedged_complete(prompt, max_tokens, temperature, json_mode, model)
+            else:
+                completion = self.backend.complete(prompt, max_tokens, temperature, json_mode, model)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        latency = time.monotonic() - started
+        self.latencies.add(latency)
+        self.breaker.record_success(latency)
+        return completion
+
+    def _hedged_complete(self, *args):
+        # Attempts run in copies of the caller's context so both are metered to the caller
+        primary = self._pool.submit(contextvars.copy_context().run, self.backend.complete, *args)
+        done, _ = wait([primary], timeout=self.hedge_delay())
+        if done:
+            return primary.result()
+
+        backup = self._pool.submit(contextvars.copy_context().run, self.backend.complete, *args)
+        error = None
+        # The first attempt to succeed wins; the other is left to finish in the background
+        for future in as_completed([primary, backup]):
+            try:
+                return future.result()
+            except Exception as e:
+                error = e
+        raise error
+
+    async def acomplete(self, prompt, max_tokens, temperature=None, json_mode=False, model=None):
+        """Async complete() sharing the same breaker, latency window and hedging policy."""
+        self.breaker.before_call()
+        started = time.monotonic()
+        try:
+            if self.hedge:
+                completion = await self._hedged_acomplete(prompt, max_tokens, temperature, json_mode, model)
+            else:
+                completion = await self.backend.acomplete(prompt, max_tokens, temperature, json_mode, model)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        latency = time.monotonic() - started
+        self.latencies.add(latency)
+        self.breaker.record_success(latency)
+        return completion
+
+    async def _hedged_acomplete(self, *args):
+        # Tasks copy the caller's context, so both attempts are metered to the caller
+        primary = asyncio.ensure_future(self.backend.acomplete(*args))
+        done, _ = await asyncio.wait([primary], timeout=self.hedge_delay())
+        if done:
+            return primary.result()
+
+        backup = asyncio.ensure_future(self.backend.acomplete(*args))
+        error = None
+        for future in asyncio.as_completed([primary, backup]):
+            try:
+                return await future
+            except Exception as e:
+                error = e
+        raise error
+
+    def stream(self, prompt, max_tokens, temperature=None, model=None):
+        """Stream a completion unless the circuit is open; time to first token counts as latency."""
+        self.breaker.before_call()
+        started = time.monotonic()
+        first_token = None
+        try:
+            for fragment in self.backend.stream(prompt, max_tokens, temperature, model):
+                if first_token is None:
+                    first_token = time.monotonic() - started
+                yield fragment
+        except GeneratorExit:
+            # The client went away; the backend itself was healthy
+            self.breaker.record_success(first_token or 0.0)
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success(first_token if first_token is not None else time.monotonic() - started)
+
+BACKENDS = {
+    "openai": lambda: OpenAIBackend(api_key=os.environ.get("OPENAI_API_KEY")),
+    "local": LocalBackend,
+    "fake": FakeBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """Return the configured backend, creating it (and its HTTP pool) on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if LLM_BACKEND not in BACKENDS:
+                    raise ValueError(f"Unknown LLM_BACKEND: {LLM_BACKEND}")
+                _backend = GuardedBackend(BACKENDS[LLM_BACKEND]())
+    return _backend
+
+def backend_stats():
+    """Breaker state and latency of the active backend, or None before the first call."""
+    backend = _backend
+    if backend is None:
+        return None
+    return dict(backend.breaker.stats(), backend=backend.name, p95_latency=backend.latencies.percentile(0.95))
+
+def set_backend(backend):
+    """Replace the active backend, e.g. with a FakeBackend in benchmarks."""
+    global _backend
+    with _backend_lock:
+        _backend = GuardedBackend(backend)
@@ -1,10 +1,37 @@
-from flask import Flask, render_template, session, request, redirect, flash, url_for
+from flask import Flask, render_template, session, request, redirect, flash, url_for, jsonify, Response, stream_with_context, g
 import os
+import json
+import time
+import cProfile
+import threading
+import base64
+import zlib
 import logging
+from markupsafe import Markup, escape
+from datetime import datetime, timezone
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.orm import DeclarativeBase, make_transient_to_detached, load_only
 from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy.sql import func
+from sqlalchemy.exc import IntegrityError
+from cache import LRUCache, summary_cache, make_cache_key
+from batch import BATCH_MAX_ITEMS, dedupe_urls, run_batch
+from chunking import chunk_cache
+from articles import article_store, extract_article_from_url, normalize_url
+from search import SEARCH_RESULTS_LIMIT, summary_search
+from highlight import highlight_interests
+from dedup import near_duplicates, minhash_signature
+from ratelimit import rate_limiter
+from budget import token_budget
+from interests import interest_index, digest_period
+from topics import topic_index
+from migrations import run_migrations
+from metrics import registry, http_request_seconds, span, start_trace, end_trace, server_timing
+from llm import LLM_BACKEND, backend_stats
+from summarizer import (
+    generate_summary as generate_summary_ai, stream_summary, clean_text, generate_base_summary, derive_summary,
+    generate_basic_summary, BASE_READING_LEVEL
+)
 
 # Create the base class
 class Base(DeclarativeBase):
@@ -22,6 +49,13 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 }
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Largest request body accepted, checked against Content-Length before the body is read;
+# a chunked upload is cut off once it passes the limit. Both give a 413.
+MAX_INPUT_BYTES = int(os.environ.get("MAX_INPUT_BYTES", str(2 * 1024 * 1024)))
+app.config["MAX_CONTENT_LENGTH"] = MAX_INPUT_BYTES
+# Werkzeug caps a single form field separately (500 KB by default); pasted articles go up to the same limit
+app.config["MAX_FORM_MEMORY_SIZE"] = MAX_INPUT_BYTES
+
 # Create DB connection
 db = SQLAlchemy(model_class=Base)
 db.init_app(app)
@@ -36,6 +70,7 @@ class User(db.Model):
     reading_level = db.Column(db.String(20), default="medium")
     summary_length = db.Column(db.String(20), default="medium")
     interests = db.Column(db.Text, default="general")
+    summary_engine = db.Column(db.String(20), default="ai")
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -46,21 +81,280 @@ class User(db.Model):
     def get_interests_list(self):
         return [interest.strip() for interest in self.interests.split(',')]
 
+# Compress stored article text above this many bytes (0 disables compression)
+COMPRESS_TEXT_MIN_BYTES = int(os.environ.get("COMPRESS_TEXT_MIN_BYTES", "1024"))
+
 class Summary(db.Model):
+    # History pages read a user's summaries newest first
+    __table_args__ = (db.Index('ix_summary_user_date', 'user_id', 'date_created', 'id'),)
+    
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
-    original_text = db.Column(db.Text, nullable=False)
     summarized_text = db.Column(db.Text, nullable=False)
     source_url = db.Column(db.String(500))
-    date_created = db.Column(db.DateTime(timezone=True), default=func.now())
+    # Set in Python with microseconds so keyset cursors compare exactly on every backend
+    date_created = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    summary_length = db.Column(db.String(20), default="medium")
+    reading_level = db.Column(db.String(20), default="medium")
+    key_topics = db.Column(db.Text)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # The full article lives in its own table so listings never load it
+    content = db.relationship('SummaryContent', uselist=False, lazy='select', cascade='all, delete-orphan')
+    variants = db.relationship('SummaryVariant', lazy='select', cascade='all, delete-orphan')
+    
+    @property
+    def original_text(self):
+        return self.content.get_text() if self.content else None
+    
+    @original_text.setter
+    def original_text(self, text):
+        self.content = SummaryContent.from_text(text)
+
+class SummaryContent(db.Model):
+    summary_id = db.Column(db.Integer, db.ForeignKey('summary.id'), primary_key=True)
+    body = db.Column(db.LargeBinary, nullable=False)
+    compressed = db.Column(db.Boolean, default=False, nullable=False)
+    
+    @classmethod
+    def from_text(cls, text):
+        data = text.encode('utf-8')
+        if COMPRESS_TEXT_MIN_BYTES and len(data) >= COMPRESS_TEXT_MIN_BYTES:
+            return cls(body=zlib.compress(data, 6), compressed=True)
+        return cls(body=data, compressed=False)
+    
+    def get_text(self):
+        data = zlib.decompress(self.body) if self.compressed else self.body
+        return data.decode('utf-8')
+
+# summary_length of the stored base summary a summary's other variants are derived from
+BASE_VARIANT = "base"
+
+class SummaryVariant(db.Model):
+    # Other lengths and reading levels of a summary, derived on request from its base summary
+    __table_args__ = (
+        db.UniqueConstraint('summary_id', 'summary_length', 'reading_level', name='uq_summary_variant'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    summary_id = db.Column(db.Integer, db.ForeignKey('summary.id'), nullable=False)
+    summary_length = db.Column(db.String(20), nullable=False)
+    reading_level = db.Column(db.String(20), nullable=False)
+    summarized_text = db.Column(db.Text, nullable=False)
+
+class SummaryCacheEntry(db.Model):
+    cache_key = db.Column(db.String(64), primary_key=True)
+    summary = db.Column(db.Text, nullable=False)
+    key_topics = db.Column(db.Text, nullable=False)
+    # Epoch seconds keep TTL comparisons portable across SQLite and PostgreSQL
+    created_at = db.Column(db.Float, nullable=False, index=True)
+    expires_at = db.Column(db.Float, nullable=False, index=True)
+
+class ArticleFingerprint(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    # Summary settings the stored result was produced with
+    settings_key = db.Column(db.String(64), nullable=False, index=True)
+    # MinHash signature as packed uint32 values
+    signature = db.Column(db.LargeBinary, nullable=False)
+    summary = db.Column(db.Text, nullable=False)
+    key_topics = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.Float, nullable=False)
+
+class FingerprintBand(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    band_key = db.Column(db.String(40), nullable=False, index=True)
+    fingerprint_id = db.Column(db.Integer, db.ForeignKey('article_fingerprint.id'), nullable=False, index=True)
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    # queued -> running -> done | failed
+    status = db.Column(db.String(20), default="queued", nullable=False, index=True)
+    title = db.Column(db.String(200))
+    source_url = db.Column(db.String(500))
+    original_text = db.Column(db.Text)
     summary_length = db.Column(db.String(20), default="medium")
     reading_level = db.Column(db.String(20), default="medium")
+    interests = db.Column(db.Text)
+    engine = db.Column(db.String(20), default="ai")
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text)
+    date_created = db.Column(db.DateTime(timezone=True), default=func.now())
+    date_started = db.Column(db.DateTime(timezone=True))
+    # Renewed by the worker while the job runs; jobs whose heartbeat stops are requeued
+    heartbeat_at = db.Column(db.DateTime(timezone=True))
+    date_finished = db.Column(db.DateTime(timezone=True))
+    summary_id = db.Column(db.Integer, db.ForeignKey('summary.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'error': self.error,
+            'summary_id': self.summary_id,
+            'summary_url': url_for('view_summary', summary_id=self.summary_id) if self.summary_id else None
+        }
+
+class Feed(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(500), unique=True, nullable=False)
+    title = db.Column(db.String(200))
+    etag = db.Column(db.String(200))
+    last_modified = db.Column(db.String(100))
+    # Epoch seconds; failures drive the exponential poll backoff
+    last_polled_at = db.Column(db.Float)
+    next_poll_at = db.Column(db.Float, default=0.0, nullable=False, index=True)
+    failures = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text)
+    added_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+
+class FeedItem(db.Model):
+    __table_args__ = (db.UniqueConstraint('feed_id', 'guid', name='uq_feed_item_guid'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    feed_id = db.Column(db.Integer, db.ForeignKey('feed.id'), nullable=False)
+    guid = db.Column(db.String(500), nullable=False)
+    url = db.Column(db.String(500), index=True)
+    title = db.Column(db.String(200))
+    description = db.Column(db.Text)
+    published_at = db.Column(db.DateTime(timezone=True))
+    # new -> processing -> done | failed
+    status = db.Column(db.String(20), default="new", nullable=False, index=True)
+    summarized_text = db.Column(db.Text)
     key_topics = db.Column(db.Text)
+    date_created = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+class FeedDelivery(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'item_id', name='uq_feed_delivery_user_item'),
+        db.Index('ix_feed_delivery_user_id_desc', 'user_id', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    item_id = db.Column(db.Integer, db.ForeignKey('feed_item.id'), nullable=False)
+    item = db.relationship('FeedItem', lazy='joined')
+
+class UserInterest(db.Model):
+    # The (term, user_id) index is the inverted index from interest to readers
+    __table_args__ = (db.Index('ix_user_interest_term_user', 'term', 'user_id'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    term = db.Column(db.String(100), nullable=False)
+
+class TopicTermFrequency(db.Model):
+    # Hash bucket of a word or two-word phrase; negative buckets hold corpus totals
+    bucket = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    # Number of stored articles containing a term of this bucket
+    documents = db.Column(db.BigInteger, nullable=False)
+    # Epoch seconds of the last change, so processes reload only what moved
+    updated_at = db.Column(db.Float, nullable=False, index=True)
+
+class TopicDocument(db.Model):
+    # SHA-1 of an article counted in the topic statistics, so re-summarized articles count once
+    content_hash = db.Column(db.String(40), primary_key=True)
+
+class Digest(db.Model):
+    __table_args__ = (db.UniqueConstraint('user_id', 'period', name='uq_digest_user_period'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    period = db.Column(db.String(20), nullable=False)
+    # JSON list of [feed item id, score, matched interests], best first
+    entries = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.Float, nullable=False)
+
+class TokenUsage(db.Model):
+    __table_args__ = (db.UniqueConstraint('user_id', 'day', 'model', name='uq_token_usage_user_day_model'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False, index=True)
+    model = db.Column(db.String(100), nullable=False)
+    prompt_tokens = db.Column(db.Integer, default=0, nullable=False)
+    completion_tokens = db.Column(db.Integer, default=0, nullable=False)
+    requests = db.Column(db.Integer, default=0, nullable=False)
+
+class RateLimitBucket(db.Model):
+    key = db.Column(db.String(100), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    # Epoch seconds of the last refill
+    updated_at = db.Column(db.Float, nullable=False)
+
+class Article(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(500), unique=True, nullable=False)
+    title = db.Column(db.String(200))
+    raw_html = db.Column(db.Text)
+    text = db.Column(db.Text)
+    etag = db.Column(db.String(200))
+    last_modified = db.Column(db.String(100))
+    # Epoch seconds of the last download and the last successful revalidation
+    fetched_at = db.Column(db.Float)
+    checked_at = db.Column(db.Float)
+
+# Attach the shared tier of the summary and chunk caches
+summary_cache.init_app(app, db, SummaryCacheEntry)
+chunk_cache.init_app(app, db, SummaryCacheEntry)
+article_store.init_app(app, db, Article)
+summary_search.init_app(app, db, Summary)
+near_duplicates.init_app(app, db, ArticleFingerprint, FingerprintBand)
+rate_limiter.init_app(app, db, RateLimitBucket)
+token_budget.init_app(app, db, TokenUsage)
+interest_index.init_app(app, db, UserInterest, User)
+topic_index.init_app(app, db, TopicTermFrequency, TopicDocument, Summary)
+
+# Seconds a logged-in user's row may be served from memory (0 disables the identity cache)
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", "0"))
+user_cache = LRUCache(max_size=1024, ttl=USER_CACHE_TTL) if USER_CACHE_TTL > 0 else None
+
+# Number of summaries per history page
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", "20"))
+
+# When enabled, /summarize enqueues a Job for worker.py instead of summarizing inline
+JOB_QUEUE_ENABLED = os.environ.get("JOB_QUEUE_ENABLED", "0") == "1"
 
-# Create tables
-with app.app_context():
-    db.create_all()
+# Requests carrying an X-Profile header are profiled in debug mode or when this is enabled (never in production)
+PROFILE_REQUESTS = os.environ.get("PROFILE_REQUESTS", "0") == "1"
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+# cProfile allows one active profiler per process, so concurrent requests run unprofiled
+profile_lock = threading.Lock()
+
+def init_db():
+    """Create missing tables, migrate existing ones, build search indexes and backfill derived tables. Safe to run repeatedly."""
+    with app.app_context():
+        db.create_all()
+        # Before the backfills, which read the migrated columns
+        run_migrations(db)
+        summary_search.create_index()
+        interest_index.backfill(User)
+        topic_index.backfill(SummaryContent)
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create or upgrade the database schema (run once per deploy)."""
+    init_db()
+    print("Database initialized")
+
+def warm_up():
+    """Import heavy dependencies before the first request instead of during it.
+    
+    Only modules and static data are loaded (no connections, threads or clients), so this is safe
+    to run in the gunicorn master before forking, where the loaded modules are shared copy-on-write.
+    """
+    # Import here so plain imports of main stay fast
+    from articles import get_extractor
+    from chunking import count_tokens
+    from dedup import hash_coefficients
+    # NumPy and SciPy for the extractive engine
+    import extractive
+    
+    get_extractor()
+    hash_coefficients()
+    count_tokens("warm up")
+    if LLM_BACKEND in ("openai", "local"):
+        import httpx
+        import openai
 
 # Utility Functions
 def is_valid_email(email):
@@ -71,49 +365,178 @@ def is_valid_url(url):
     """Check if the input is a valid URL."""
     return url.startswith('http://') or url.startswith('https://')
 
-def generate_summary(text, length="medium", reading_level="medium", interests=None):
-    """Generate summary using the advanced summarizer module."""
-    # Import here to avoid circular imports
-    from summarizer import generate_summary as generate_summary_ai
+def load_user(user_id):
+    """Load a user by id, consulting the short-TTL identity cache when enabled."""
+    if not user_id:
+        return None
+    
+    if user_cache is not None:
+        snapshot = user_cache.get(user_id)
+        if snapshot is not None:
+            # Rebuild a detached instance and attach it without querying
+            user = User(**snapshot)
+            make_transient_to_detached(user)
+            return db.session.merge(user, load=False)
+    
+    user = db.session.get(User, user_id)
+    if user is not None and user_cache is not None:
+        user_cache.set(user_id, {column.key: getattr(user, column.key) for column in User.__table__.columns})
+    return user
+
+def get_current_user():
+    """Return the logged-in user, loaded at most once per request."""
+    if 'current_user' not in g:
+        g.current_user = load_user(session.get('user_id'))
+    return g.current_user
+
+def forget_user(user_id):
+    """Drop a user from the identity cache after their row changes."""
+    if user_cache is not None:
+        user_cache.delete(user_id)
+
+def encode_cursor(summary):
+    """Encode a summary's position in the history ordering as an opaque cursor."""
+    position = f"{summary.date_created.isoformat()}|{summary.id}"
+    return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Decode a history cursor into (date_created, id)."""
+    date_created, summary_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+    return datetime.fromisoformat(date_created), int(summary_id)
+
+def get_summary_page(user_id, cursor=None, page_size=HISTORY_PAGE_SIZE):
+    """Return one page of a user's summaries, newest first, and the cursor for the next page."""
+    query = (
+        Summary.query
+        .options(load_only(
+            Summary.id, Summary.title, Summary.source_url, Summary.date_created,
+            Summary.summary_length, Summary.reading_level, Summary.key_topics
+        ))
+        .filter(Summary.user_id == user_id)
+    )
     
-    # Use the AI-powered summarizer from summarizer.py
-    result = generate_summary_ai(text, length, reading_level, interests)
+    if cursor:
+        # Keyset pagination: continue strictly after the last row of the previous page
+        date_created, summary_id = decode_cursor(cursor)
+        query = query.filter(db.or_(
+            Summary.date_created < date_created,
+            db.and_(Summary.date_created == date_created, Summary.id < summary_id)
+        ))
+    
+    rows = query.order_by(Summary.date_created.desc(), Summary.id.desc()).limit(page_size + 1).all()
+    summaries = rows[:page_size]
+    next_cursor = encode_cursor(summaries[-1]) if len(rows) > page_size else None
+    return summaries, next_cursor
+
+def find_summary(cleaned_text, length="medium", reading_level="medium", interests=None, engine="ai"):
+    """Look for a stored summary of this content and these settings.
+    
+    Returns (result or None, keys); pass the keys to remember_summary once a new summary is generated.
+    """
+    # Serve repeat requests for the same content and settings from the cache
+    cache_key = make_cache_key(cleaned_text, length, reading_level, interests, engine)
+    with span("cache_lookup"):
+        result = summary_cache.get(cache_key)
+    if result is not None:
+        return result, None
+    
+    # Syndicated copies of an article already summarized with these settings reuse its summary
+    with span("near_duplicate_lookup"):
+        signature = minhash_signature(cleaned_text)
+        settings_key = make_cache_key('', length, reading_level, interests, engine)
+        result = near_duplicates.find(signature, settings_key)
+    if result is not None:
+        summary_cache.set(cache_key, result)
+    
+    return result, (cache_key, signature, settings_key)
+
+def remember_summary(keys, result):
+    """Store a newly generated summary for exact and near-duplicate reuse."""
+    cache_key, signature, settings_key = keys
+    near_duplicates.add(signature, settings_key, result)
+    summary_cache.set(cache_key, result)
+
+def generate_summary(text, length="medium", reading_level="medium", interests=None, engine="ai"):
+    """Generate summary using the advanced summarizer module."""
+    # Cleaned once here; the cache keys and every summarization step use the same copy
+    text = clean_text(text)
+    result, keys = find_summary(text, length, reading_level, interests, engine)
+    if result is None:
+        # Use the AI-powered summarizer from summarizer.py
+        result = generate_summary_ai(text, length, reading_level, interests, engine)
+        remember_summary(keys, result)
     
     return result
 
-def extract_article_from_url(url):
-    """Extract article content from a URL using trafilatura."""
+def get_base_summary(summary, text):
+    """Return a summary's stored base summary, writing and storing it on first use, or None if it cannot be written."""
+    base = SummaryVariant.query.filter_by(summary_id=summary.id, summary_length=BASE_VARIANT).first()
+    if base is not None:
+        return base.summarized_text
+    
     try:
-        # Using trafilatura to extract content from URL
-        import trafilatura
-        downloaded = trafilatura.fetch_url(url)
-        
-        if not downloaded:
-            return None, "Failed to download content from URL"
-        
-        # Extract main text content
-        text = trafilatura.extract(downloaded)
-        
-        if not text:
-            return None, "No content extracted from URL"
-        
-        # Get a title from the URL (remove protocol and domain)
-        import re
-        title = url
-        # Remove protocol
-        title = re.sub(r'^https?://', '', title)
-        # Remove domain
-        title = re.sub(r'^[^/]+/', '', title)
-        # Replace dashes with spaces and capitalize
-        title = ' '.join(word.capitalize() for word in title.replace('-', ' ').split())
-        
-        return {
-            'title': title[:100],  # Limit title length
-            'text': text,
-            'url': url
-        }, None
+        # Shared through the cache with every other summary of the same article
+        base_summary = generate_base_summary(text)
     except Exception as e:
-        return None, f"Error processing URL: {str(e)}"
+        logging.error(f"Base summary generation failed: {str(e)}")
+        return None
+    
+    # Committed on its own so a conflict on the variant cannot roll the base back
+    db.session.add(SummaryVariant(
+        summary_id=summary.id,
+        summary_length=BASE_VARIANT,
+        reading_level=BASE_READING_LEVEL,
+        summarized_text=base_summary
+    ))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent request stored the base first
+        db.session.rollback()
+    return base_summary
+
+def create_summary_variant(summary, user, length, reading_level):
+    """Derive and store a summary at another length and reading level.
+    
+    Returns None for summaries without stored article text. When the base summary cannot be written
+    the variant is an extractive one that is shown but not stored, so a later view retries.
+    """
+    original_text = summary.original_text
+    if not original_text:
+        return None
+    text = clean_text(original_text)
+    
+    interests = user.get_interests_list()
+    engine = token_budget.engine_for(user.id, user.summary_engine)
+    base_summary = None
+    with token_budget.meter(user.id):
+        if engine != "extractive":
+            base_summary = get_base_summary(summary, text)
+        if base_summary is not None:
+            # A rewrite of the base summary, not another pass over the whole article
+            summarized_text = derive_summary(base_summary, length, reading_level, interests)
+        else:
+            summarized_text = generate_basic_summary(text, length, reading_level, interests)
+    
+    variant = SummaryVariant(
+        summary_id=summary.id,
+        summary_length=length,
+        reading_level=reading_level,
+        summarized_text=summarized_text
+    )
+    if engine != "extractive" and base_summary is None:
+        return variant
+    
+    db.session.add(variant)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent request stored this variant first
+        db.session.rollback()
+        variant = SummaryVariant.query.filter_by(
+            summary_id=summary.id, summary_length=length, reading_level=reading_level
+        ).first()
+    return variant
 
 def get_reading_level_options():
     """Return reading level options for the UI."""
@@ -131,6 +554,20 @@ def get_summary_length_options():
         {'value': 'detailed', 'label': 'Detailed - Comprehensive summary'}
     ]
 
+def get_summary_engine_options():
+    """Return summarization engine options for the UI."""
+    return [
+        {'value': 'ai', 'label': 'AI - Written by GPT-4o'},
+        {'value': 'extractive', 'label': 'Extractive - Key sentences, instant and free'}
+    ]
+
+def get_summary_engine(value, default="ai"):
+    """Return a valid summarization engine name."""
+    valid_engines = [option['value'] for option in get_summary_engine_options()]
+    if value in valid_engines:
+        return value
+    return default if default in valid_engines else "ai"
+
 def get_interest_categories():
     """Return common interest categories for the UI."""
     return [
@@ -219,7 +656,7 @@ def profile():
         flash('Please log in to view your profile', 'warning')
         return redirect(url_for('login'))
     
-    user = User.query.get(user_id)
+    user = get_current_user()
     if not user:
         flash('User not found', 'danger')
         return redirect(url_for('index'))
@@ -228,6 +665,7 @@ def profile():
         # Update user preferences
         reading_level = request.form.get('reading_level', 'medium')
         summary_length = request.form.get('summary_length', 'medium')
+        summary_engine = get_summary_engine(request.form.get('summary_engine'))
         interests = request.form.getlist('interests')
         
         # Validate input
@@ -240,27 +678,47 @@ def profile():
         # Update user preferences
         user.reading_level = reading_level
         user.summary_length = summary_length
+        user.summary_engine = summary_engine
         user.interests = ','.join(interests) if interests else 'general'
         
         # Save changes
         db.session.commit()
+        forget_user(user.id)
         
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('profile'))
     
-    # Get user's summaries
-    summaries = Summary.query.filter_by(user_id=user.id).order_by(Summary.date_created.desc()).limit(5).all()
+    # Get user's most recent summaries without loading their text
+    summaries, next_cursor = get_summary_page(user.id, page_size=5)
+    summary_count = db.session.query(func.count(Summary.id)).filter(Summary.user_id == user.id).scalar()
     
     return render_template(
-        'profile.html',
+        'profiles.html',
         user=user,
         summaries=summaries,
+        summary_count=summary_count,
+        has_more_summaries=next_cursor is not None,
         reading_level_options=get_reading_level_options(),
         summary_length_options=get_summary_length_options(),
+        summary_engine_options=get_summary_engine_options(),
         interest_categories=get_interest_categories(),
         selected_interests=user.get_interests_list()
     )
 
+def enqueue_summary_job(user, summary_length, reading_level, engine, **source):
+    """Queue a summary for worker.py; source is either source_url or title and original_text."""
+    job = Job(
+        summary_length=summary_length,
+        reading_level=reading_level,
+        interests=user.interests,
+        engine=engine,
+        user_id=user.id,
+        **source
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
 @app.route('/summarize', methods=['GET', 'POST'])
 def summarize():
     """Summarize content route."""
@@ -270,7 +728,7 @@ def summarize():
         flash('Please log in to use the summarization feature', 'warning')
         return redirect(url_for('login'))
     
-    user = User.query.get(user_id)
+    user = get_current_user()
     if not user:
         flash('User not found', 'danger')
         return redirect(url_for('index'))
@@ -278,9 +736,21 @@ def summarize():
     summary = None
     
     if request.method == 'POST':
+        allowed, retry_after = rate_limiter.check(user.id)
+        if not allowed:
+            flash(f'Too many summaries requested. Please try again in {int(retry_after) + 1} seconds.', 'warning')
+            return redirect(url_for('summarize'))
+        
         content_type = request.form.get('content_type')
         reading_level = request.form.get('reading_level', user.reading_level)
         summary_length = request.form.get('summary_length', user.summary_length)
+        engine = get_summary_engine(request.form.get('summary_engine'), user.summary_engine)
+        
+        # Users over their daily token budget get the local engine instead of an error
+        requested_engine = engine
+        engine = token_budget.engine_for(user.id, engine)
+        if engine != requested_engine:
+            flash('Daily AI usage limit reached. This summary uses the local extractive engine.', 'info')
         
         if content_type == 'url':
             url = request.form.get('url_input')
@@ -292,6 +762,11 @@ def summarize():
                 flash('Invalid URL format', 'danger')
                 return redirect(url_for('summarize'))
             
+            if JOB_QUEUE_ENABLED:
+                # Download and extraction happen in the worker
+                job = enqueue_summary_job(user, summary_length, reading_level, engine, source_url=url)
+                return render_template('job.html', job=job)
+            
             article, error = extract_article_from_url(url)
             if error:
                 flash(f'Error extracting article: {error}', 'danger')
@@ -310,14 +785,20 @@ def summarize():
             title = request.form.get('title', 'Custom Text')
             original_text = text_input
             source_url = None
+            
+            if JOB_QUEUE_ENABLED:
+                job = enqueue_summary_job(user, summary_length, reading_level, engine, title=title, original_text=original_text)
+                return render_template('job.html', job=job)
         
         # Generate summary
-        summary_result = generate_summary(
-            original_text, 
-            length=summary_length,
-            reading_level=reading_level,
-            interests=user.get_interests_list()
-        )
+        with token_budget.meter(user.id):
+            summary_result = generate_summary(
+                original_text, 
+                length=summary_length,
+                reading_level=reading_level,
+                interests=user.get_interests_list(),
+                engine=engine
+            )
         
         # Create summary object
         summary = Summary(
@@ -333,7 +814,8 @@ def summarize():
         
         # Save summary to database
         db.session.add(summary)
-        db.session.commit()
+        with span("db_commit"):
+            db.session.commit()
         
         flash('Summary generated successfully!', 'success')
     
@@ -341,14 +823,418 @@ def summarize():
         'summary.html',
         reading_level_options=get_reading_level_options(),
         summary_length_options=get_summary_length_options(),
+        summary_engine_options=get_summary_engine_options(),
         current_summary_length=user.summary_length,
         current_reading_level=user.reading_level,
+        current_summary_engine=user.summary_engine,
+        # Queued summaries are written by the worker, so there is nothing to stream
+        stream_enabled=not JOB_QUEUE_ENABLED,
         summary=summary
     )
 
+def rate_limited(retry_after):
+    """429 response for API clients that exceeded their request rate."""
+    response = jsonify({'error': 'Too many requests', 'retry_after': round(retry_after, 1)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(int(retry_after) + 1)
+    return response
+
+def format_sse(event, data):
+    """Format a single server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/summarize/stream', methods=['POST'])
+def summarize_stream():
+    """Stream a summary to the browser over server-sent events as it is generated."""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'User not found'}), 401
+    
+    content_type = request.form.get('content_type')
+    reading_level = request.form.get('reading_level', user.reading_level)
+    summary_length = request.form.get('summary_length', user.summary_length)
+    engine = token_budget.engine_for(user.id, get_summary_engine(request.form.get('summary_engine'), user.summary_engine))
+    interests = user.get_interests_list()
+    
+    allowed, retry_after = rate_limiter.check(user.id)
+    if not allowed:
+        return rate_limited(retry_after)
+    
+    if content_type == 'url':
+        url = request.form.get('url_input')
+        if not url:
+            return jsonify({'error': 'URL is required'}), 400
+        if not is_valid_url(url):
+            return jsonify({'error': 'Invalid URL format'}), 400
+    else:
+        text_input = request.form.get('text_input')
+        if not text_input:
+            return jsonify({'error': 'Text content is required'}), 400
+        title = request.form.get('title', 'Custom Text')
+    
+    if JOB_QUEUE_ENABLED:
+        # The worker writes the summary; poll the job instead of streaming
+        if content_type == 'url':
+            job = enqueue_summary_job(user, summary_length, reading_level, engine, source_url=url)
+        else:
+            job = enqueue_summary_job(user, summary_length, reading_level, engine, title=title, original_text=text_input)
+        return jsonify(dict(job.to_dict(), status_url=url_for('job_status', job_id=job.id))), 202
+    
+    def generate():
+        if content_type == 'url':
+            yield format_sse('status', {'message': 'Fetching article...'})
+            article, error = extract_article_from_url(url)
+            if error:
+                yield format_sse('error', {'error': f'Error extracting article: {error}'})
+                return
+            article_title, original_text, source_url = article['title'], article['text'], article['url']
+        else:
+            article_title, original_text, source_url = title, text_input, None
+        
+        cleaned_text = clean_text(original_text)
+        summary_result, keys = find_summary(cleaned_text, summary_length, reading_level, interests, engine)
+        
+        if summary_result is None:
+            with token_budget.meter(user_id):
+                if engine == 'ai':
+                    for event, data in stream_summary(cleaned_text, summary_length, reading_level, interests):
+                        if event == 'token':
+                            yield format_sse('token', {'text': data})
+                        else:
+                            summary_result = data
+                else:
+                    # Local engines finish instantly, so there is nothing to stream
+                    summary_result = generate_summary_ai(cleaned_text, summary_length, reading_level, interests, engine)
+            remember_summary(keys, summary_result)
+        
+        # Persist the finished summary once generation completes
+        summary = Summary(
+            title=article_title,
+            original_text=original_text,
+            summarized_text=summary_result['summary'],
+            source_url=source_url,
+            summary_length=summary_length,
+            reading_level=reading_level,
+            key_topics=','.join(summary_result['key_topics']),
+            user_id=user_id
+        )
+        db.session.add(summary)
+        with span("db_commit"):
+            db.session.commit()
+        
+        yield format_sse('done', {
+            'summary': summary_result['summary'],
+            'key_topics': summary_result['key_topics'],
+            'summary_id': summary.id,
+            'summary_url': url_for('view_summary', summary_id=summary.id)
+        })
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/summarize/batch', methods=['GET', 'POST'])
+def summarize_batch():
+    """Summarize several URLs or texts at once, streaming results as they finish."""
+    user_id = session.get('user_id')
+    if not user_id:
+        if request.method == 'POST':
+            return jsonify({'error': 'Authentication required'}), 401
+        flash('Please log in to use the summarization feature', 'warning')
+        return redirect(url_for('login'))
+    
+    user = get_current_user()
+    if not user:
+        flash('User not found', 'danger')
+        return redirect(url_for('index'))
+    
+    if request.method == 'GET':
+        return render_template(
+            'batch.html',
+            reading_level_options=get_reading_level_options(),
+            summary_length_options=get_summary_length_options(),
+            summary_engine_options=get_summary_engine_options(),
+            current_summary_length=user.summary_length,
+            current_reading_level=user.reading_level,
+            current_summary_engine=user.summary_engine,
+            max_items=BATCH_MAX_ITEMS
+        )
+    
+    # Accept either a JSON body or the batch form
+    payload = request.get_json(silent=True) or {}
+    if payload:
+        if not isinstance(payload, dict):
+            return jsonify({'error': 'Expected a JSON object'}), 400
+        urls = payload.get('urls') or []
+        texts = payload.get('texts') or []
+        # A string would otherwise be summarized one character per item
+        if not isinstance(urls, list) or not isinstance(texts, list):
+            return jsonify({'error': 'urls and texts must be lists'}), 400
+        if not all(isinstance(url, str) for url in urls):
+            return jsonify({'error': 'Each URL must be a string'}), 400
+        summary_length = payload.get('summary_length', user.summary_length)
+        reading_level = payload.get('reading_level', user.reading_level)
+        engine = get_summary_engine(payload.get('summary_engine'), user.summary_engine)
+    else:
+        urls = request.form.get('urls', '').splitlines()
+        texts = []
+        summary_length = request.form.get('summary_length', user.summary_length)
+        reading_level = request.form.get('reading_level', user.reading_level)
+        engine = get_summary_engine(request.form.get('summary_engine'), user.summary_engine)
+    
+    items = [{'url': url} for url in dedupe_urls(urls)]
+    for entry in texts:
+        if isinstance(entry, str):
+            entry = {'text': entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get('text') or '', str) or not isinstance(entry.get('title') or '', str):
+            return jsonify({'error': 'Each text must be a string or an object with string text and title'}), 400
+        if entry.get('text'):
+            items.append({'text': entry['text'], 'title': entry.get('title') or 'Custom Text'})
+    
+    if not items:
+        return jsonify({'error': 'At least one URL or text is required'}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({'error': f'At most {BATCH_MAX_ITEMS} items can be summarized at once'}), 400
+    
+    # Each item is one summary against the rate limit; a batch larger than the burst could never be allowed
+    max_cost = rate_limiter.max_cost()
+    if max_cost is not None and len(items) > max_cost:
+        return jsonify({'error': f'At most {max_cost} items can be summarized at once under the rate limit'}), 429
+    allowed, retry_after = rate_limiter.check(user.id, cost=len(items))
+    if not allowed:
+        return rate_limited(retry_after)
+    
+    engine = token_budget.engine_for(user.id, engine)
+    interests = user.get_interests_list()
+    
+    def process_item(item, host_slot):
+        # Runs on a pool thread, which needs its own application context
+        with app.app_context():
+            try:
+                if item.get('url'):
+                    if not is_valid_url(item['url']):
+                        return {'url': item['url'], 'error': 'Invalid URL format'}
+                    # Only the download counts against the per-host limit
+                    with host_slot:
+                        article, error = extract_article_from_url(item['url'])
+                    if error:
+                        return {'url': item['url'], 'error': error}
+                    item = dict(item, title=article['title'], text=article['text'])
+                
+                summary_result = generate_summary(
+                    item['text'],
+                    length=summary_length,
+                    reading_level=reading_level,
+                    interests=interests,
+                    engine=engine
+                )
+                return dict(item, summary=summary_result['summary'], key_topics=summary_result['key_topics'])
+            except Exception as e:
+                logging.error(f"Batch item failed: {str(e)}")
+                return {'url': item.get('url'), 'error': str(e)}
+    
+    def generate():
+        completed = []
+        with token_budget.meter(user_id):
+            for index, result in run_batch(items, process_item):
+                line = {'index': index, 'url': result.get('url'), 'title': result.get('title')}
+                if result.get('error'):
+                    line['error'] = result['error']
+                else:
+                    line['summary'] = result['summary']
+                    line['key_topics'] = result['key_topics']
+                    completed.append((index, result))
+                yield json.dumps(line) + '\n'
+        
+        # Store every successful summary in a single transaction
+        summaries = [
+            Summary(
+                title=result['title'],
+                original_text=result['text'],
+                summarized_text=result['summary'],
+                source_url=result.get('url'),
+                summary_length=summary_length,
+                reading_level=reading_level,
+                key_topics=','.join(result['key_topics']),
+                user_id=user_id
+            )
+            for index, result in sorted(completed, key=lambda pair: pair[0])
+        ]
+        db.session.add_all(summaries)
+        with span("db_commit"):
+            db.session.commit()
+        
+        yield json.dumps({
+            'done': True,
+            'summaries': [
+                {'id': summary.id, 'url': url_for('view_summary', summary_id=summary.id)}
+                for summary in summaries
+            ]
+        }) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/history')
+def history():
+    """Paginated list of the user's summaries."""
+    user = get_current_user()
+    if not user:
+        flash('Please log in to view your summaries', 'warning')
+        return redirect(url_for('login'))
+    
+    try:
+        summaries, next_cursor = get_summary_page(user.id, request.args.get('cursor'))
+    except ValueError:
+        return redirect(url_for('history'))
+    
+    return render_template('history.html', summaries=summaries, next_cursor=next_cursor)
+
+@app.route('/search')
+def search():
+    """Full-text search over the user's summaries."""
+    user = get_current_user()
+    if not user:
+        flash('Please log in to search your summaries', 'warning')
+        return redirect(url_for('login'))
+    
+    query = request.args.get('q', '').strip()
+    results = summary_search.search(user.id, query) if query else []
+    
+    return render_template('search.html', query=query, results=results)
+
+@app.route('/api/search')
+def api_search():
+    """Full-text search results as JSON."""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    try:
+        limit = min(max(int(request.args.get('limit', SEARCH_RESULTS_LIMIT)), 1), 100)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    
+    results = summary_search.search(user_id, request.args.get('q', ''), limit)
+    for result in results:
+        result['url'] = url_for('view_summary', summary_id=result['id'])
+    
+    return jsonify({'results': results})
+
+@app.route('/feeds', methods=['GET', 'POST'])
+def feeds():
+    """Subscribe to news feeds and read the items matched to the user's interests."""
+    user = get_current_user()
+    if not user:
+        flash('Please log in to view your news feed', 'warning')
+        return redirect(url_for('login'))
+    
+    if request.method == 'POST':
+        url = request.form.get('feed_url', '').strip()
+        if not is_valid_url(url):
+            flash('Invalid feed URL', 'danger')
+            return redirect(url_for('feeds'))
+        
+        url = normalize_url(url)
+        if Feed.query.filter_by(url=url).first():
+            flash('That feed is already being followed', 'info')
+        else:
+            # Picked up by the feed scheduler (feeds.py) on its next pass
+            db.session.add(Feed(url=url, added_by=user.id))
+            db.session.commit()
+            flash('Feed added. New stories will appear here shortly.', 'success')
+        return redirect(url_for('feeds'))
+    
+    deliveries = (
+        FeedDelivery.query
+        .filter_by(user_id=user.id)
+        .order_by(FeedDelivery.id.desc())
+        .limit(HISTORY_PAGE_SIZE)
+        .all()
+    )
+    # Feed summaries are shared, so each reader's interests are highlighted at display time
+    interests = user.get_interests_list()
+    items = [feed_item_view(delivery.item, interests) for delivery in deliveries]
+    
+    return render_template('feeds.html', items=items, feeds=Feed.query.order_by(Feed.title).all())
+
+def feed_item_view(item, interests):
+    """Display fields of a feed item. Feeds are added by any user, so their text and links are untrusted."""
+    return {
+        'title': item.title,
+        # Only web links; older rows may hold javascript: and other schemes
+        'url': item.url if item.url and is_valid_url(item.url) else None,
+        'published_at': item.published_at,
+        # Escaped before highlighting, so the highlight spans are the only markup
+        'summary': Markup(highlight_interests(str(escape(item.summarized_text or '')), interests)),
+        'key_topics': item.key_topics.split(',') if item.key_topics else []
+    }
+
+@app.route('/digest')
+def digest():
+    """The user's precomputed digest for the latest period."""
+    user = get_current_user()
+    if not user:
+        flash('Please log in to view your digest', 'warning')
+        return redirect(url_for('login'))
+    
+    # Built by digests.py; one lookup on the (user_id, period) index
+    latest = (
+        Digest.query
+        .filter(Digest.user_id == user.id, Digest.period <= digest_period())
+        .order_by(Digest.period.desc())
+        .first()
+    )
+    entries = json.loads(latest.entries) if latest else []
+    stories = {item.id: item for item in FeedItem.query.filter(FeedItem.id.in_([entry[0] for entry in entries]))}
+    
+    interests = user.get_interests_list()
+    items = [
+        dict(feed_item_view(stories[item_id], interests), matched=matched)
+        for item_id, score, matched in entries
+        if item_id in stories
+    ]
+    
+    return render_template('digest.html', items=items, period=latest.period if latest else None)
+
+@app.route('/api/summaries')
+def api_summaries():
+    """Paginated summary history as JSON."""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    try:
+        page_size = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), 100)
+        summaries, next_cursor = get_summary_page(user_id, request.args.get('cursor'), page_size)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor or limit'}), 400
+    
+    return jsonify({
+        'summaries': [
+            {
+                'id': summary.id,
+                'title': summary.title,
+                'source_url': summary.source_url,
+                'date_created': summary.date_created.isoformat(),
+                'summary_length': summary.summary_length,
+                'reading_level': summary.reading_level,
+                'key_topics': summary.key_topics.split(',') if summary.key_topics else [],
+                'url': url_for('view_summary', summary_id=summary.id)
+            }
+            for summary in summaries
+        ],
+        'next_cursor': next_cursor
+    })
+
 @app.route('/summary/<int:summary_id>')
 def view_summary(summary_id):
-    """View a specific summary."""
+    """View a specific summary, optionally at another length and reading level."""
     # Check if user is logged in
     user_id = session.get('user_id')
     if not user_id:
@@ -363,26 +1249,177 @@ def view_summary(summary_id):
         flash('You do not have permission to view this summary', 'danger')
         return redirect(url_for('profile'))
     
-    return render_template('view_summary.html', summary=summary)
+    reading_level_options = get_reading_level_options()
+    summary_length_options = get_summary_length_options()
+    length = request.args.get('length', summary.summary_length)
+    reading_level = request.args.get('reading_level', summary.reading_level)
+    if length not in [option['value'] for option in summary_length_options]:
+        length = summary.summary_length
+    if reading_level not in [option['value'] for option in reading_level_options]:
+        reading_level = summary.reading_level
+    
+    variant = None
+    if (length, reading_level) != (summary.summary_length, summary.reading_level):
+        variant = SummaryVariant.query.filter_by(
+            summary_id=summary.id, summary_length=length, reading_level=reading_level
+        ).first()
+        if variant is None:
+            # Deriving a new variant costs a (small) LLM call, so it counts against the rate limit
+            allowed, retry_after = rate_limiter.check(user_id)
+            if allowed:
+                variant = create_summary_variant(summary, get_current_user(), length, reading_level)
+                if variant is None:
+                    flash('The original text of this summary is not stored, so it cannot be rewritten', 'info')
+            else:
+                flash(f'Too many summaries requested. Please try again in {int(retry_after) + 1} seconds.', 'warning')
+    
+    return render_template(
+        'view_summary.html',
+        summary=summary,
+        variant=variant,
+        reading_level_options=reading_level_options,
+        summary_length_options=summary_length_options
+    )
+
+@app.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    """Return the status of a summarization job."""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    job = Job.query.get_or_404(job_id)
+    if job.user_id != user_id:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(job.to_dict())
+
+@app.route('/api/usage')
+def api_usage():
+    """Today's LLM token usage and remaining budget for the current user."""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    used = token_budget.used_today(user_id)
+    return jsonify({
+        'tokens_used_today': used,
+        'daily_budget': token_budget.user_budget or None,
+        'tokens_remaining': max(token_budget.user_budget - used, 0) if token_budget.user_budget else None
+    })
+
+@app.route('/cache/stats')
+def cache_stats():
+    """Expose summary cache hit/miss counters."""
+    return jsonify(dict(summary_cache.stats(), near_duplicates=near_duplicates.stats()))
+
+@registry.collector
+def collect_cache_and_backend_metrics():
+    """Cache hit rates and LLM circuit state, read at scrape time."""
+    lookups = []
+    hit_rates = []
+    for name, cache in (('summary', summary_cache), ('chunk', chunk_cache)):
+        stats = cache.stats()
+        lookups += [
+            ({'cache': name, 'result': 'memory_hit'}, stats['memory_hits']),
+            ({'cache': name, 'result': 'db_hit'}, stats['db_hits']),
+            ({'cache': name, 'result': 'miss'}, stats['misses']),
+        ]
+        hit_rates.append(({'cache': name}, stats['hit_rate']))
+    stats = near_duplicates.stats()
+    lookups += [
+        ({'cache': 'near_duplicate', 'result': 'hit'}, stats['hits']),
+        ({'cache': 'near_duplicate', 'result': 'miss'}, stats['misses']),
+    ]
+    hit_rates.append(({'cache': 'near_duplicate'}, stats['hit_rate']))
+    
+    families = [
+        ('cache_lookups_total', 'counter', 'Cache lookups by outcome.', lookups),
+        ('cache_hit_ratio', 'gauge', 'Share of cache lookups served without generating.', hit_rates),
+    ]
+    
+    backend = backend_stats()
+    if backend is not None:
+        labels = {'backend': backend['backend']}
+        families.append(('llm_circuit_open', 'gauge', '1 while the LLM circuit breaker is not closed.',
+                         [(labels, int(backend['state'] != 'closed'))]))
+        if backend['p95_latency'] is not None:
+            families.append(('llm_latency_p95_seconds', 'gauge', 'Rolling p95 latency of LLM calls.',
+                             [(labels, backend['p95_latency'])]))
+    return families
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint (per process)."""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.before_request
+def start_request_metrics():
+    """Start timing the request, collecting its stage spans and, if asked for, profiling it."""
+    g.request_started = time.perf_counter()
+    g.trace_token = start_trace()
+    if request.headers.get('X-Profile') and (PROFILE_REQUESTS or app.debug) and profile_lock.acquire(blocking=False):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def finish_request_metrics(response):
+    """Record request latency and expose the stage spans in a Server-Timing header."""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        profile_lock.release()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}-{request.endpoint or 'unknown'}.prof")
+        profiler.dump_stats(path)
+        response.headers['X-Profile-File'] = path
+    
+    # Streaming responses are timed to their first byte
+    if 'request_started' in g:
+        http_request_seconds.observe(
+            time.perf_counter() - g.request_started,
+            endpoint=request.endpoint or 'unknown',
+            method=request.method,
+            status=response.status_code
+        )
+    
+    token = g.pop('trace_token', None)
+    if token is not None:
+        spans = end_trace(token)
+        if spans:
+            response.headers['Server-Timing'] = server_timing(spans)
+    return response
+
+@app.teardown_request
+def stop_request_profiler(exc):
+    """Release the profiler of a request that failed before its response was built."""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        profile_lock.release()
 
 # Make current user available to templates
 @app.context_processor
 def inject_user():
-    user_id = session.get('user_id')
-    if user_id:
-        user = User.query.get(user_id)
-        if user:
-            return dict(current_user={'is_authenticated': True, 'username': user.username, 'id': user.id})
+    user = get_current_user()
+    if user:
+        return dict(current_user={'is_authenticated': True, 'username': user.username, 'id': user.id})
     return dict(current_user={'is_authenticated': False, 'username': 'Guest', 'id': None})
 
 @app.errorhandler(404)
 def page_not_found(e):
     return render_template('index.html', error="Page not found"), 404
 
+@app.errorhandler(413)
+def request_too_large(e):
+    return render_template('index.html', error=f"Text is too long (limit {MAX_INPUT_BYTES // 1024} KB)"), 413
+
 @app.errorhandler(500)
 def internal_server_error(e):
     return render_template('index.html', error="Internal server error"), 500
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
+    # The development server sets up the schema itself; deployments run `flask --app main init-db`
+    init_db()
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,172 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Stage timings of the request or job currently running, if it is being traced
+_current_spans = ContextVar("stage_spans", default=None)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter, one value per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self.values)
+        for key, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labels, key), value
+
+class Histogram:
+    """Cumulative bucket histogram with sum and count, one series per label combination."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then the running sum
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self.series.items()}
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", _format_labels(self.labels, key, [('le', _format_value(float(bound)))]), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labels, key), total
+            yield f"{self.name}_count", _format_labels(self.labels, key), cumulative
+
+class Registry:
+    """Process-wide metrics rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """Register fn() -> [(name, kind, help, [(labels dict, value)])] for values read at scrape time."""
+        self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in metric.samples())
+        for collect in self.collectors:
+            for name, kind, help_text, samples in collect():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+# Shared registry and the metrics every process records
+registry = Registry()
+stage_seconds = registry.histogram(
+    "summarizer_stage_seconds", "Time spent in each summarization stage.", ("stage",)
+)
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "Time to produce a response, per endpoint.", ("endpoint", "method", "status")
+)
+llm_tokens = registry.counter("llm_tokens_total", "LLM tokens used, per model and kind.", ("model", "kind"))
+llm_requests = registry.counter("llm_requests_total", "Completed LLM requests, per model.", ("model",))
+
+def start_trace():
+    """Collect the spans of the current request or job; returns the token for end_trace."""
+    return _current_spans.set([])
+
+def end_trace(token):
+    """Stop collecting spans and return them as (stage, seconds) pairs."""
+    spans = _current_spans.get() or []
+    _current_spans.reset(token)
+    return spans
+
+@contextmanager
+def span(stage):
+    """Time a block as one stage, in the shared histogram and the current trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage=stage)
+        spans = _current_spans.get()
+        if spans is not None:
+            # Pool threads share the caller's list through the copied context
+            spans.append((stage, elapsed))
+
+def timed(stage):
+    """Decorator form of span()."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def server_timing(spans):
+    """Format spans as a Server-Timing header value, summing repeated stages."""
+    totals = {}
+    for stage, elapsed in spans:
+        totals[stage] = totals.get(stage, 0.0) + elapsed
+    return ', '.join(f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in totals.items())
@@ -0,0 +1,105 @@
+import logging
+
+from sqlalchemy import Column, Integer, MetaData, Table, inspect, select, text
+
+# Schema changes to tables that existed before, in the order they were made. db.create_all() only
+# creates missing tables, so every change to an existing table needs an entry here.
+MIGRATIONS = []
+
+_metadata = MetaData()
+schema_version = Table('schema_version', _metadata, Column('version', Integer, nullable=False))
+
+def migration(version):
+    """Register a function as the schema change bringing the database up to version."""
+    def register(func):
+        MIGRATIONS.append((version, func))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return func
+    return register
+
+def has_column(conn, table, column):
+    return column in {info['name'] for info in inspect(conn).get_columns(table)}
+
+def quote(conn, name):
+    # "user" is a reserved word on PostgreSQL
+    return conn.dialect.identifier_preparer.quote(name)
+
+def mapped_model(db, table):
+    """The model class mapped to a table, so migrations use the same encoding as the app."""
+    for mapper in db.Model.registry.mappers:
+        if mapper.class_.__table__.name == table:
+            return mapper.class_
+    raise LookupError(f"No model for table {table}")
+
+def current_version(conn):
+    _metadata.create_all(conn, checkfirst=True)
+    version = conn.execute(select(schema_version.c.version)).scalar()
+    if version is None:
+        conn.execute(schema_version.insert().values(version=0))
+        return 0
+    return version
+
+def run_migrations(db):
+    """Apply every migration newer than the database's schema version. Call inside an app context.
+
+    Each migration runs in its own transaction together with the version bump, and checks the schema
+    before changing it, so databases created by db.create_all() pass through without changes.
+    """
+    with db.engine.begin() as conn:
+        version = current_version(conn)
+    for target, func in MIGRATIONS:
+        if target <= version:
+            continue
+        with db.engine.begin() as conn:
+            func(conn, db)
+            conn.execute(schema_version.update().values(version=target))
+        logging.info(f"Database schema migrated to version {target} ({func.__name__})")
+        version = target
+    return version
+
+@migration(1)
+def add_summary_engine(conn, db):
+    """Store each user's summary engine and each job's engine, defaulting to the AI engine everyone used before."""
+    for table, column in (('user', 'summary_engine'), ('job', 'engine')):
+        if not inspect(conn).has_table(table):
+            continue
+        if not has_column(conn, table, column):
+            conn.exec_driver_sql(f"ALTER TABLE {quote(conn, table)} ADD COLUMN {column} VARCHAR(20) DEFAULT 'ai'")
+        conn.exec_driver_sql(f"UPDATE {quote(conn, table)} SET {column} = 'ai' WHERE {column} IS NULL")
+
+@migration(2)
+def move_original_text(conn, db):
+    """Move article text from summary.original_text into summary_content and index history pages."""
+    if has_column(conn, 'summary', 'original_text'):
+        content = mapped_model(db, 'summary_content')
+        last_id = 0
+        while True:
+            rows = conn.execute(text(
+                "SELECT id, original_text FROM summary WHERE id > :last_id AND original_text IS NOT NULL "
+                "AND NOT EXISTS (SELECT 1 FROM summary_content WHERE summary_content.summary_id = summary.id) "
+                "ORDER BY id LIMIT 500"
+            ), {'last_id': last_id}).all()
+            if not rows:
+                break
+            values = []
+            for summary_id, original in rows:
+                stored = content.from_text(original)
+                values.append({'summary_id': summary_id, 'body': stored.body, 'compressed': stored.compressed})
+            conn.execute(content.__table__.insert(), values)
+            last_id = rows[-1][0]
+        # New rows no longer write the column, so it cannot stay NOT NULL; SQLite needs 3.35 or later
+        conn.exec_driver_sql("ALTER TABLE summary DROP COLUMN original_text")
+    if conn.dialect.name == 'sqlite':
+        # The old CURRENT_TIMESTAMP default stored no microseconds, and history cursors compare these strings
+        conn.exec_driver_sql(
+            "UPDATE summary SET date_created = date_created || '.000000' WHERE length(date_created) = 19"
+        )
+    for index in mapped_model(db, 'summary').__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+@migration(3)
+def add_job_heartbeat(conn, db):
+    """Record when a worker last renewed its claim on a running job."""
+    if inspect(conn).has_table('job') and not has_column(conn, 'job', 'heartbeat_at'):
+        column = mapped_model(db, 'job').__table__.c.heartbeat_at
+        conn.exec_driver_sql(f"ALTER TABLE job ADD COLUMN heartbeat_at {column.type.compile(conn.dialect)}")
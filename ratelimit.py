@@ -0,0 +1,185 @@
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy.exc import IntegrityError
+
+from utils import LazyEngine
+
+# Rate limit configuration: sustained requests per minute and burst size (0 disables a limit)
+RATE_LIMIT_PER_MINUTE = float(os.environ.get("RATE_LIMIT_PER_MINUTE", "10"))
+RATE_LIMIT_BURST = int(os.environ.get("RATE_LIMIT_BURST", "5"))
+GLOBAL_RATE_LIMIT_PER_MINUTE = float(os.environ.get("GLOBAL_RATE_LIMIT_PER_MINUTE", "0"))
+GLOBAL_RATE_LIMIT_BURST = int(os.environ.get("GLOBAL_RATE_LIMIT_BURST", "50"))
+# "memory" (per process), "db" (shared through the database) or "redis"
+RATE_LIMIT_STORE = os.environ.get("RATE_LIMIT_STORE", "memory")
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+
+def refill(tokens, updated_at, now, rate, capacity):
+    """Return the bucket level after refilling at `rate` tokens per second."""
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+class MemoryStore:
+    """Token buckets held in this process."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, cost, rate, capacity, consume=True):
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = refill(tokens, updated_at, now, rate, capacity)
+            allowed = tokens >= cost
+            if not consume:
+                return allowed, 0.0 if allowed else (cost - tokens) / rate
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+class DatabaseStore(LazyEngine):
+    """Token buckets in a database table, shared by every worker process."""
+
+    def __init__(self, app, db, model):
+        self.app = app
+        self.db = db
+        self.model = model
+
+    def take(self, key, cost, rate, capacity, consume=True):
+        if not consume:
+            return self._peek(key, cost, rate, capacity, time.time())
+        for _ in range(5):
+            try:
+                with self.engine.begin() as conn:
+                    result = self._take(conn, key, cost, rate, capacity, time.time())
+            except IntegrityError:
+                # Another process created the bucket first
+                continue
+            if result is not None:
+                return result
+        return False, 1.0
+
+    def _peek(self, key, cost, rate, capacity, now):
+        table = self.model.__table__
+        with self.engine.connect() as conn:
+            row = conn.execute(table.select().where(table.c.key == key)).first()
+        tokens = capacity if row is None else refill(row.tokens, row.updated_at, now, rate, capacity)
+        return tokens >= cost, 0.0 if tokens >= cost else (cost - tokens) / rate
+
+    def _take(self, conn, key, cost, rate, capacity, now):
+        table = self.model.__table__
+        row = conn.execute(table.select().where(table.c.key == key)).first()
+        if row is None:
+            if capacity < cost:
+                return False, (cost - capacity) / rate
+            conn.execute(table.insert().values(key=key, tokens=capacity - cost, updated_at=now))
+            return True, 0.0
+
+        tokens = refill(row.tokens, row.updated_at, now, rate, capacity)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        # Compare-and-set on the previous timestamp so concurrent takes cannot both win
+        result = conn.execute(
+            table.update()
+            .where(table.c.key == key, table.c.updated_at == row.updated_at)
+            .values(tokens=tokens, updated_at=now)
+        )
+        if result.rowcount != 1:
+            return None
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+# Atomic refill-and-take on the Redis server
+_REDIS_TAKE = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local rate, capacity, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local consume = ARGV[5] == '1'
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+local allowed = 0
+if tokens >= cost then
+    allowed = 1
+end
+if not consume then
+    return {allowed, tostring(tokens)}
+end
+if allowed == 1 then
+    tokens = tokens - cost
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return {allowed, tostring(tokens)}
+"""
+
+class RedisStore:
+    """Token buckets on a Redis-compatible server."""
+
+    def __init__(self, url=RATE_LIMIT_REDIS_URL):
+        # Import here so redis is only required when this store is selected
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(_REDIS_TAKE)
+
+    def take(self, key, cost, rate, capacity, consume=True):
+        allowed, tokens = self.script(
+            keys=[f"ratelimit:{key}"], args=[rate, capacity, cost, time.time(), 1 if consume else 0]
+        )
+        if allowed:
+            return True, 0.0
+        return False, (cost - float(tokens)) / rate
+
+class RateLimiter:
+    """Per-user and global token-bucket limits for summarization endpoints."""
+
+    def __init__(self):
+        self.store = MemoryStore()
+
+    def init_app(self, app, db, model):
+        """Select the bucket store; falls back to in-process buckets if it is unavailable."""
+        try:
+            if RATE_LIMIT_STORE == "db":
+                self.store = DatabaseStore(app, db, model)
+            elif RATE_LIMIT_STORE == "redis":
+                self.store = RedisStore()
+        except Exception as e:
+            logging.error(f"Rate limit store unavailable, using in-process buckets: {str(e)}")
+
+    def buckets(self, user_id):
+        """(key, tokens per second, capacity) of every enabled bucket a user's request draws from."""
+        buckets = []
+        if RATE_LIMIT_PER_MINUTE > 0:
+            buckets.append((f"user:{user_id}", RATE_LIMIT_PER_MINUTE / 60.0, RATE_LIMIT_BURST))
+        if GLOBAL_RATE_LIMIT_PER_MINUTE > 0:
+            buckets.append(("global", GLOBAL_RATE_LIMIT_PER_MINUTE / 60.0, GLOBAL_RATE_LIMIT_BURST))
+        return buckets
+
+    def max_cost(self):
+        """The largest cost a single check can ever allow, or None when no limit is enabled."""
+        capacities = [capacity for _, _, capacity in self.buckets(None)]
+        return min(capacities) if capacities else None
+
+    def check(self, user_id, cost=1):
+        """Consume `cost` requests for a user. Returns (allowed, seconds until retry)."""
+        try:
+            buckets = self.buckets(user_id)
+            # Every bucket is checked before any is drawn from, so a refusal costs nothing
+            for key, rate, capacity in buckets:
+                allowed, retry_after = self.store.take(key, cost, rate, capacity, consume=False)
+                if not allowed:
+                    return False, retry_after
+            for key, rate, capacity in buckets:
+                allowed, retry_after = self.store.take(key, cost, rate, capacity)
+                if not allowed:
+                    # Lost a race with a concurrent request since the check
+                    return False, retry_after
+        except Exception as e:
+            # A broken shared store should not take summarization down with it
+            logging.error(f"Rate limit check failed: {str(e)}")
+        return True, 0.0
+
+# Shared rate limiter
+rate_limiter = RateLimiter()
@@ -0,0 +1,199 @@
+import logging
+import os
+import re
+
+from markupsafe import escape
+from sqlalchemy import event, text
+
+# Search configuration
+SEARCH_RESULTS_LIMIT = int(os.environ.get("SEARCH_RESULTS_LIMIT", "20"))
+
+_TAG_RE = re.compile(r'<[^>]*>')
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+# Private-use markers survive escaping and are swapped for <mark> afterwards
+_MARK_START = '\ue000'
+_MARK_END = '\ue001'
+
+POSTGRES_DOCUMENT = (
+    "to_tsvector('english', coalesce(summary.title, '') || ' ' || "
+    "coalesce(summary.key_topics, '') || ' ' || coalesce(summary.summarized_text, ''))"
+)
+
+def strip_tags(value):
+    """Remove highlight spans and other markup before indexing."""
+    return _TAG_RE.sub('', value or '')
+
+def render_snippet(snippet):
+    """Escape a snippet and turn match markers into <mark> tags."""
+    return str(escape(snippet or '')).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+def build_fts_query(query):
+    """Turn free text into a safe FTS5 query: every term must match, the last as a prefix."""
+    terms = _TERM_RE.findall(query)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+class SummarySearch:
+    """Full-text search over a user's summaries, backed by SQLite FTS5 or PostgreSQL tsvector."""
+
+    def __init__(self):
+        self.db = None
+        self.model = None
+        self.backend = None
+        # Whether summary_fts exists, checked once per process
+        self.fts_ready = None
+
+    def init_app(self, app, db, model):
+        """Pick the backend for the configured database and keep the index in sync."""
+        self.db = db
+        self.model = model
+        dialect = app.config["SQLALCHEMY_DATABASE_URI"].split(':', 1)[0].split('+', 1)[0]
+        if dialect == 'sqlite':
+            self.backend = 'fts5'
+        elif dialect in ('postgres', 'postgresql'):
+            self.backend = 'postgres'
+        else:
+            self.backend = 'like'
+
+        if self.backend == 'fts5':
+            # Incremental maintenance of the FTS table on every write path, once init-db has created it
+            event.listen(model, 'after_insert', self._index_row)
+            event.listen(model, 'after_update', self._reindex_row)
+            event.listen(model, 'after_delete', self._unindex_row)
+
+    def create_index(self):
+        """Create the search index if needed and backfill it. Call inside an app context."""
+        try:
+            if self.backend == 'fts5':
+                self._create_fts5()
+            elif self.backend == 'postgres':
+                with self.db.engine.begin() as conn:
+                    conn.execute(text(
+                        f"CREATE INDEX IF NOT EXISTS ix_summary_search ON summary USING GIN ({POSTGRES_DOCUMENT})"
+                    ))
+        except Exception as e:
+            logging.error(f"Search index unavailable, falling back to LIKE queries: {str(e)}")
+            self.backend = 'like'
+
+    def _fts5_exists(self, conn):
+        return conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'summary_fts'"
+        )).first() is not None
+
+    def _fts5_ready(self, conn):
+        """Whether the FTS table can be used; without it this process falls back to LIKE queries."""
+        if self.backend != 'fts5':
+            return False
+        if self.fts_ready is None:
+            self.fts_ready = self._fts5_exists(conn)
+            if not self.fts_ready:
+                logging.warning("Search index table missing, falling back to LIKE queries; run `flask --app main init-db`")
+                self.backend = 'like'
+        return self.fts_ready
+
+    def _create_fts5(self):
+        with self.db.engine.begin() as conn:
+            if self._fts5_exists(conn):
+                self.fts_ready = True
+                return
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE summary_fts USING fts5("
+                "title, key_topics, summarized_text, user_id UNINDEXED, tokenize = 'porter unicode61')"
+            ))
+            # Backfill rows written before the index existed
+            rows = conn.execute(text("SELECT id, title, key_topics, summarized_text, user_id FROM summary"))
+            for row in rows.fetchall():
+                self._insert(conn, row.id, row.title, row.key_topics, row.summarized_text, row.user_id)
+        self.fts_ready = True
+
+    def _insert(self, conn, summary_id, title, key_topics, summarized_text, user_id):
+        conn.execute(
+            text(
+                "INSERT INTO summary_fts (rowid, title, key_topics, summarized_text, user_id) "
+                "VALUES (:id, :title, :key_topics, :summarized_text, :user_id)"
+            ),
+            {
+                'id': summary_id,
+                'title': title or '',
+                'key_topics': (key_topics or '').replace(',', ' '),
+                'summarized_text': strip_tags(summarized_text),
+                'user_id': user_id
+            }
+        )
+
+    def _index_row(self, mapper, connection, target):
+        if not self._fts5_ready(connection):
+            return
+        self._insert(connection, target.id, target.title, target.key_topics, target.summarized_text, target.user_id)
+
+    def _reindex_row(self, mapper, connection, target):
+        self._unindex_row(mapper, connection, target)
+        self._index_row(mapper, connection, target)
+
+    def _unindex_row(self, mapper, connection, target):
+        if not self._fts5_ready(connection):
+            return
+        connection.execute(text("DELETE FROM summary_fts WHERE rowid = :id"), {'id': target.id})
+
+    def search(self, user_id, query, limit=SEARCH_RESULTS_LIMIT):
+        """Return ranked matches for one user's summaries, each with an HTML snippet."""
+        if not query or not query.strip():
+            return []
+        if self._fts5_ready(self.db.session.connection()):
+            return self._search_fts5(user_id, query, limit)
+        if self.backend == 'postgres':
+            return self._search_postgres(user_id, query, limit)
+        return self._search_like(user_id, query, limit)
+
+    def _search_fts5(self, user_id, query, limit):
+        match = build_fts_query(query)
+        if match is None:
+            return []
+        rows = self.db.session.execute(
+            text(
+                "SELECT rowid AS id, title, "
+                f"snippet(summary_fts, -1, '{_MARK_START}', '{_MARK_END}', '…', 16) AS snippet "
+                "FROM summary_fts WHERE summary_fts MATCH :match AND user_id = :user_id "
+                # Title and topic hits count for more than body hits
+                "ORDER BY bm25(summary_fts, 5.0, 3.0, 1.0) LIMIT :limit"
+            ),
+            {'match': match, 'user_id': user_id, 'limit': limit}
+        )
+        return [{'id': row.id, 'title': row.title, 'snippet': render_snippet(row.snippet)} for row in rows]
+
+    def _search_postgres(self, user_id, query, limit):
+        rows = self.db.session.execute(
+            text(
+                "SELECT summary.id AS id, summary.title AS title, "
+                f"ts_headline('english', regexp_replace(summary.summarized_text, '<[^>]*>', '', 'g'), q, "
+                f"'StartSel={_MARK_START}, StopSel={_MARK_END}, MaxWords=30, MinWords=10') AS snippet "
+                f"FROM summary, websearch_to_tsquery('english', :query) AS q "
+                f"WHERE summary.user_id = :user_id AND {POSTGRES_DOCUMENT} @@ q "
+                f"ORDER BY ts_rank({POSTGRES_DOCUMENT}, q) DESC LIMIT :limit"
+            ),
+            {'query': query, 'user_id': user_id, 'limit': limit}
+        )
+        return [{'id': row.id, 'title': row.title, 'snippet': render_snippet(row.snippet)} for row in rows]
+
+    def _search_like(self, user_id, query, limit):
+        model = self.model
+        pattern = f"%{query.strip()}%"
+        rows = (
+            model.query
+            .filter(model.user_id == user_id)
+            .filter(self.db.or_(model.title.ilike(pattern), model.key_topics.ilike(pattern), model.summarized_text.ilike(pattern)))
+            .order_by(model.date_created.desc())
+            .limit(limit)
+            .all()
+        )
+        return [
+            {'id': row.id, 'title': row.title, 'snippet': str(escape(strip_tags(row.summarized_text)[:200]))}
+            for row in rows
+        ]
+
+# Shared search index
+summary_search = SummarySearch()
@@ -2,67 +2,56 @@ import re
 import logging
 import os
 import json
-from collections import Counter
-from openai import OpenAI
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from cache import make_cache_key, summary_cache
+from highlight import highlight_interests
+from llm import get_backend, model_for
+from metrics import timed
+from topics import topic_index
+from chunking import CHUNK_TOKENS, MAX_INPUT_TOKENS, chunk_cache, count_tokens, make_chunk_key, split_into_chunks, truncate_to_tokens
 
-# Initialize OpenAI client with API key
-api_key = os.environ.get("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key)
+# "combined" asks for summary and topics in one completion, "concurrent" issues both calls in parallel,
+# "derived" writes one base summary per article and rewrites it for each length and reading level
+SUMMARY_MODE = os.environ.get("SUMMARY_MODE", "combined")
 
-def clean_text(text):
-    """Clean and preprocess the text."""
-    # Remove extra whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
-    # Remove URLs
-    text = re.sub(r'https?://\S+|www\.\S+', '', text)
-    # Remove HTML tags
-    text = re.sub(r'<.*?>', '', text)
-    return text
+# Settings of the base summary every other variant is derived from
+BASE_LENGTH = "detailed"
+BASE_READING_LEVEL = "medium"
 
-def extract_article_from_url(url):
-    """Extract article content from a URL using trafilatura."""
-    try:
-        # Using trafilatura to extract content from URL
-        import trafilatura
-        downloaded = trafilatura.fetch_url(url)
-        
-        if not downloaded:
-            return None, "Failed to download content from URL"
-        
-        # Extract main text content
-        text = trafilatura.extract(downloaded)
-        
-        if not text:
-            return None, "No content extracted from URL"
-        
-        # Get a title from the URL (remove protocol and domain)
-        import re
-        title = url
-        # Remove protocol
-        title = re.sub(r'^https?://', '', title)
-        # Remove domain
-        title = re.sub(r'^[^/]+/', '', title)
-        # Replace dashes with spaces and capitalize
-        title = ' '.join(word.capitalize() for word in title.replace('-', ' ').split())
-        
-        return {
-            'title': title[:100],  # Limit title length
-            'text': text,
-            'url': url
-        }, None
-    except Exception as e:
-        logging.error(f"Error extracting article: {str(e)}")
-        return None, f"Error processing URL: {str(e)}"
+# "local" picks key topics from corpus statistics once enough articles are stored, "ai" always asks the LLM
+TOPIC_ENGINE = os.environ.get("TOPIC_ENGINE", "local")
 
-def extract_key_topics_with_ai(text, n=5):
-    """Extract key topics using OpenAI."""
-    try:
-        # Truncate text if too long
-        max_text_length = 5000
-        if len(text) > max_text_length:
-            text = text[:max_text_length] + "..."
-        
-        prompt = f"""
+# Token budgets for topic extraction input and each map-stage chunk summary
+TOPIC_INPUT_TOKENS = int(os.environ.get("TOPIC_INPUT_TOKENS", "1200"))
+CHUNK_SUMMARY_TOKENS = int(os.environ.get("CHUNK_SUMMARY_TOKENS", "400"))
+
+# Shared pool for running independent OpenAI calls concurrently
+executor = ThreadPoolExecutor(max_workers=int(os.environ.get("SUMMARY_THREADS", "8")))
+
+def submit(fn, *args):
+    """Run fn on the shared pool in a copy of the caller's context, so usage is metered to the caller."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+# URLs and HTML tags, removed in a single pass. A tag is matched from its '<', so a URL inside a tag goes
+# with the tag and the link text stays (the old URL-first pass also deleted the text up to the next space).
+_STRIP_RE = re.compile(r'https?://\S+|www\.\S+|<[^>]*>')
+
+@timed("clean_text")
+def clean_text(text):
+    """Clean and preprocess the text.
+    
+    Done once per request: the summarization functions below expect text that is already clean.
+    """
+    # Collapse whitespace (split/join is faster than a regex and strips the ends), then drop URLs and tags
+    return _STRIP_RE.sub('', ' '.join(text.split()))
+
+def build_topics_prompt(text, n=5):
+    """Build the key topics prompt; the text is truncated to the topic input budget."""
+    # Truncate text if too long
+    text = truncate_to_tokens(text, TOPIC_INPUT_TOKENS)
+    
+    return f"""
         Extract exactly {n} key topics or concepts from the following text. 
         Return them as a JSON array of strings.
         Each topic should be a single word or short phrase (1-3 words max).
@@ -72,76 +61,171 @@ def extract_key_topics_with_ai(text, n=5):
         
         KEY TOPICS (JSON array of strings):
         """
+
+def parse_topics(completion_text, text, n=5):
+    """Read the topic list out of a key topics completion."""
+    # Extract and parse JSON from response
+    result = json.loads(completion_text)
+    
+    # Ensure the result contains a key_topics field and is a list
+    if isinstance(result, dict) and "topics" in result:
+        return result["topics"]
+    elif isinstance(result, list):
+        return result
+    else:
+        # Try to find any array in the result
+        for key, value in result.items():
+            if isinstance(value, list):
+                return value
         
-        response = client.chat.completions.create(
-            model="gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"},
-            max_tokens=200
-        )
-        
-        # Extract and parse JSON from response
-        result = json.loads(response.choices[0].message.content)
-        
-        # Ensure the result contains a key_topics field and is a list
-        if isinstance(result, dict) and "topics" in result:
-            return result["topics"]
-        elif isinstance(result, list):
-            return result
-        else:
-            # Try to find any array in the result
-            for key, value in result.items():
-                if isinstance(value, list):
-                    return value
-            
-            # Fallback to basic extraction if AI returned unexpected format
-            return extract_key_topics_basic(text, n)
+        # Fallback to basic extraction if AI returned unexpected format
+        return extract_key_topics_basic(text, n)
+
+@timed("topics")
+def extract_key_topics_with_ai(text, n=5):
+    """Extract key topics using OpenAI."""
+    try:
+        completion = get_backend().complete(build_topics_prompt(text, n), max_tokens=200, json_mode=True)
+        return parse_topics(completion.text, text, n)
     except Exception as e:
         logging.error(f"AI key topics extraction failed: {str(e)}")
         # Fallback to basic extraction on error
         return extract_key_topics_basic(text, n)
 
+@timed("local_topics")
 def extract_key_topics_basic(text, n=5):
-    """Extract key topics using basic word frequency (fallback method)."""
-    words = text.lower().split()
-    # Filter short words and common stopwords
-    filtered_words = [word for word in words if len(word) > 4 and word not in (
-        'about', 'after', 'again', 'their', 'there', 'these', 'thing', 
-        'think', 'those', 'would', 'which', 'with', 'have', 'this', 'that'
-    )]
-    
-    # Count occurrences
-    counter = Counter(filtered_words)
-    # Get the most common words
-    most_common = counter.most_common(n)
-    return [word for word, count in most_common] if most_common else ["Topic"]
+    """Extract key topics locally: words and phrases weighted by BM25 against the stored articles."""
+    return topic_index.key_topics(text, n) or ["Topic"]
 
-def generate_ai_summary(text, length="medium", reading_level="medium", interests=None):
-    """Generate a summary using OpenAI."""
+def local_topics_ready():
+    """Whether key topics come from corpus statistics instead of an LLM call."""
+    return TOPIC_ENGINE == "local" and topic_index.is_ready()
+
+def build_chunk_prompt(chunk):
+    """Build the map-stage prompt for one section of a long article."""
+    return f"""
+        Summarize the following section of a longer article in detail.
+        Keep every important fact, name, number and quotation.
+        
+        SECTION:
+        {chunk}
+        """
+
+@timed("chunk_summary")
+def summarize_chunk_with_ai(chunk):
+    """Summarize one section of a long article in detail (map stage)."""
+    # Chunk summaries do not depend on length or reading level, so they are shared across variants
+    cache_key = make_chunk_key(chunk)
+    cached = chunk_cache.get(cache_key)
+    if cached is not None:
+        return cached['summary']
+    
+    completion = get_backend().complete(build_chunk_prompt(chunk), max_tokens=CHUNK_SUMMARY_TOKENS, temperature=0.3)
+    
+    summary_text = completion.text.strip()
+    chunk_cache.set(cache_key, {'summary': summary_text, 'key_topics': []})
+    return summary_text
+
+@timed("reduce")
+def reduce_long_text(text, max_rounds=3):
+    """Condense text over the input token budget into parallel chunk summaries."""
+    for _ in range(max_rounds):
+        if count_tokens(text) <= MAX_INPUT_TOKENS:
+            break
+        chunks = split_into_chunks(text, CHUNK_TOKENS)
+        futures = [submit(summarize_chunk_with_ai, chunk) for chunk in chunks]
+        text = "\n\n".join(future.result() for future in futures)
+    return text
+
+def get_summary_instructions(length="medium", reading_level="medium", interests=None):
+    """Return the word count, reading level and interest focus used in summary prompts."""
+    # Determine desired summary length
+    if length == "brief":
+        word_count = "100-150"
+    elif length == "detailed":
+        word_count = "300-400"
+    else:  # medium
+        word_count = "200-250"
+    
+    # Determine desired reading level
+    if reading_level == "basic":
+        level_desc = "simple language, short sentences, easy to understand by elementary school students"
+    elif reading_level == "advanced":
+        level_desc = "sophisticated language, specialized terminology, suitable for experts in the field"
+    else:  # medium
+        level_desc = "balanced language complexity, suitable for general adult audience"
+    
+    # Construct interest focus if provided
+    interest_focus = ""
+    if interests and isinstance(interests, list) and len(interests) > 0:
+        interest_focus = f"Focus on aspects related to: {', '.join(interests)}. "
+    
+    return word_count, level_desc, interest_focus
+
+def build_combined_prompt(text, length="medium", reading_level="medium", interests=None, n=5):
+    """Build the prompt asking for the summary and key topics as one JSON object."""
+    word_count, level_desc, interest_focus = get_summary_instructions(length, reading_level, interests)
+    
+    # Truncate text if too long
+    text = truncate_to_tokens(text, MAX_INPUT_TOKENS)
+    
+    return f"""
+        Please create a concise summary of the following text in {word_count} words.
+        Use {level_desc}.
+        {interest_focus}
+        Maintain factual accuracy and include the most important information.
+        Also extract exactly {n} key topics or concepts from the text.
+        Each topic should be a single word or short phrase (1-3 words max).
+        
+        Respond with a JSON object of the form:
+        {{"summary": "<summary text>", "topics": ["<topic>", ...]}}
+        
+        TEXT TO SUMMARIZE:
+        {text}
+        """
+
+def parse_combined(completion_text, text, interests=None, n=5):
+    """Read summary and topics out of a combined completion; malformed output raises ValueError."""
     try:
-        # Determine desired summary length
-        if length == "brief":
-            word_count = "100-150"
-        elif length == "detailed":
-            word_count = "300-400"
-        else:  # medium
-            word_count = "200-250"
-        
-        # Determine desired reading level
-        if reading_level == "basic":
-            level_desc = "simple language, short sentences, easy to understand by elementary school students"
-        elif reading_level == "advanced":
-            level_desc = "sophisticated language, specialized terminology, suitable for experts in the field"
-        else:  # medium
-            level_desc = "balanced language complexity, suitable for general adult audience"
-        
-        # Construct interest focus if provided
-        interest_focus = ""
-        if interests and isinstance(interests, list) and len(interests) > 0:
-            interest_focus = f"Focus on aspects related to: {', '.join(interests)}. "
-        
-        # Prepare prompt for OpenAI
-        prompt = f"""
+        result = json.loads(completion_text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Combined response is not valid JSON: {str(e)}")
+    
+    summary_text = result.get("summary") if isinstance(result, dict) else None
+    key_topics = result.get("topics") if isinstance(result, dict) else None
+    if not isinstance(summary_text, str) or not summary_text.strip():
+        raise ValueError("Combined response is missing a summary")
+    if not isinstance(key_topics, list) or not key_topics:
+        key_topics = extract_key_topics_basic(text, n)
+    
+    return {
+        'summary': highlight_interests(summary_text.strip(), interests),
+        'key_topics': key_topics
+    }
+
+@timed("combined")
+def generate_combined_summary_with_ai(text, length="medium", reading_level="medium", interests=None, n=5):
+    """Generate the summary and key topics with a single structured OpenAI completion."""
+    completion = get_backend().complete(
+        build_combined_prompt(text, length, reading_level, interests, n),
+        max_tokens=1000,
+        temperature=0.7,
+        json_mode=True,
+        model=model_for(length)
+    )
+    
+    # Malformed output raises ValueError so the caller can retry with separate calls
+    return parse_combined(completion.text, text, interests, n)
+
+def build_summary_prompt(text, length="medium", reading_level="medium", interests=None):
+    """Build the OpenAI prompt for a single summary."""
+    word_count, level_desc, interest_focus = get_summary_instructions(length, reading_level, interests)
+    
+    # Limit prompt size for token constraints
+    text = truncate_to_tokens(text, MAX_INPUT_TOKENS)
+    
+    # Prepare prompt for OpenAI
+    prompt = f"""
         Please create a concise summary of the following text in {word_count} words.
         Use {level_desc}.
         {interest_focus}
@@ -150,59 +234,142 @@ def generate_ai_summary(text, length="medium", reading_level="medium", interests
         TEXT TO SUMMARIZE:
         {text}
         """
+    
+    return prompt
+
+@timed("summary")
+def generate_ai_summary(text, length="medium", reading_level="medium", interests=None):
+    """Generate a summary using OpenAI."""
+    try:
+        prompt = build_summary_prompt(text, length, reading_level, interests)
         
-        # Limit prompt size for token constraints
-        max_prompt_length = 11000
-        if len(prompt) > max_prompt_length:
-            truncated_text = text[:max_prompt_length - 1000] + "..."
-            prompt = prompt.replace(text, truncated_text)
-        
-        # Call OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=800,
-            temperature=0.7
-        )
+        # Call the configured LLM backend
+        completion = get_backend().complete(prompt, max_tokens=800, temperature=0.7, model=model_for(length))
         
         # Extract summary text
-        summary_text = response.choices[0].message.content.strip()
+        summary_text = completion.text.strip()
         
         # Highlight interests in the summary if provided
-        if interests:
-            for interest in interests:
-                # Create pattern that matches whole words only
-                pattern = r'\b' + re.escape(interest) + r'\b'
-                # Replace with highlighted version using a span with a class
-                summary_text = re.sub(
-                    pattern, 
-                    f'<span class="interest-highlight">{interest}</span>', 
-                    summary_text, 
-                    flags=re.IGNORECASE
-                )
-        
-        return summary_text
+        return highlight_interests(summary_text, interests)
     except Exception as e:
         logging.error(f"AI summary generation failed: {str(e)}")
         # Fallback to basic summary on error
         return generate_basic_summary(text, length, reading_level, interests)
 
-def generate_basic_summary(text, length="medium", reading_level="medium", interests=None):
-    """Generate a basic summary without AI (fallback method)."""
-    # Clean the text
-    text = clean_text(text)
+def make_base_key(text):
+    """Cache key of an article's base summary, shared by every user and variant."""
+    return make_cache_key(text, BASE_LENGTH, BASE_READING_LEVEL, None, "base")
+
+@timed("base_summary")
+def generate_base_summary(text):
+    """Return the detailed, interest-neutral summary of cleaned text that other variants are derived from."""
+    cache_key = make_base_key(text)
+    cached = summary_cache.get(cache_key)
+    if cached is not None:
+        return cached['summary']
     
-    # Create a simple summary based on the first few sentences
-    sentences = re.split(r'(?<=[.!?])\s+', text)
+    prompt = build_summary_prompt(reduce_long_text(text), BASE_LENGTH, BASE_READING_LEVEL)
+    completion = get_backend().complete(prompt, max_tokens=800, temperature=0.3, model=model_for(BASE_LENGTH))
+    base_summary = completion.text.strip()
+    summary_cache.set(cache_key, {'summary': base_summary, 'key_topics': []})
+    return base_summary
+
+def build_variant_prompt(base_summary, length="medium", reading_level="medium", interests=None):
+    """Build the prompt rewriting a base summary for other settings; it is a fraction of the article's size."""
+    word_count, level_desc, interest_focus = get_summary_instructions(length, reading_level, interests)
     
-    if length == "brief":
-        num_sentences = min(3, len(sentences))
-    elif length == "detailed":
-        num_sentences = min(8, len(sentences))
-    else:  # medium
-        num_sentences = min(5, len(sentences))
+    return f"""
+        Rewrite the following news summary in {word_count} words.
+        Use {level_desc}.
+        {interest_focus}
+        Use only facts stated in the summary.
+        
+        SUMMARY:
+        {base_summary}
+        """
+
+@timed("variant")
+def derive_summary(base_summary, length="medium", reading_level="medium", interests=None):
+    """Rewrite a base summary at another length and reading level."""
+    if length == BASE_LENGTH and reading_level == BASE_READING_LEVEL and not interests:
+        return base_summary
+    try:
+        completion = get_backend().complete(
+            build_variant_prompt(base_summary, length, reading_level, interests),
+            max_tokens=600,
+            temperature=0.5,
+            model=model_for(length)
+        )
+        return highlight_interests(completion.text.strip(), interests)
+    except Exception as e:
+        logging.error(f"Summary variant generation failed: {str(e)}")
+        return generate_basic_summary(base_summary, length, reading_level, interests)
+
+def generate_derived_summary(text, length="medium", reading_level="medium", interests=None):
+    """Summarize cleaned text by rewriting its base summary; topics come from the base when not local."""
+    topics_future = submit(extract_key_topics_basic, text) if local_topics_ready() else None
+    base_summary = generate_base_summary(text)
+    if topics_future is None:
+        topics_future = submit(extract_key_topics_with_ai, base_summary)
+    summary_text = derive_summary(base_summary, length, reading_level, interests)
+    return {
+        'summary': summary_text,
+        'key_topics': topics_future.result()
+    }
+
+def stream_ai_summary(prompt, length="medium"):
+    """Yield summary text fragments from the LLM backend as they are generated."""
+    yield from get_backend().stream(prompt, max_tokens=800, temperature=0.7, model=model_for(length))
+
+def stream_summary(text, length="medium", reading_level="medium", interests=None):
+    """Stream a summary of cleaned text as ("token", text) events followed by a final ("done", result) event."""
+    try:
+        if SUMMARY_MODE == "derived":
+            # The base summary is written first; its rewrite for these settings is streamed
+            reduced_text = generate_base_summary(text)
+            prompt = build_variant_prompt(reduced_text, length, reading_level, interests)
+        else:
+            # Long articles are condensed before the final summary is streamed
+            reduced_text = reduce_long_text(text)
+            prompt = build_summary_prompt(reduced_text, length, reading_level, interests)
+    except Exception as e:
+        logging.error(f"Summary input preparation failed: {str(e)}")
+        yield "done", {
+            'summary': generate_basic_summary(text, length, reading_level, interests),
+            'key_topics': extract_key_topics_basic(text)
+        }
+        return
+    # Key topics are extracted alongside the streamed summary
+    if local_topics_ready():
+        topics_future = submit(extract_key_topics_basic, text)
+    else:
+        topics_future = submit(extract_key_topics_with_ai, reduced_text)
+    text = reduced_text
     
-    summary_text = " ".join(sentences[:num_sentences])
+    parts = []
+    try:
+        for fragment in stream_ai_summary(prompt, length):
+            parts.append(fragment)
+            yield "token", fragment
+        summary_text = highlight_interests("".join(parts).strip(), interests)
+    except Exception as e:
+        logging.error(f"AI summary streaming failed: {str(e)}")
+        # Fallback to basic summary on error
+        summary_text = generate_basic_summary(text, length, reading_level, interests)
+    
+    yield "done", {
+        'summary': summary_text,
+        'key_topics': topics_future.result()
+    }
+
+@timed("extractive_summary")
+def generate_basic_summary(text, length="medium", reading_level="medium", interests=None):
+    """Generate an extractive summary without AI (fallback and zero-cost engine)."""
+    # Import here so NumPy/SciPy load only when the local engine is used
+    from extractive import extract_sentences
+    
+    # Pick the highest-ranked sentences for the user's length, level and interests
+    summary_text = " ".join(extract_sentences(text, length, reading_level, interests))
     
     # Adjust for reading level
     if reading_level == "basic":
@@ -211,31 +378,46 @@ def generate_basic_summary(text, length="medium", reading_level="medium", intere
         summary_text = re.sub(r'([.!?])\s*([A-Z])', r'\1\n\2', summary_text)  # Add newlines after periods
     
     # If user interests are provided, highlight relevant sections
-    if interests:
-        for interest in interests:
-            # Simple highlighting: add emphasis to sentences containing the interest
-            pattern = r'\b' + re.escape(interest) + r'\b'
-            summary_text = re.sub(
-                pattern, 
-                f'<span class="interest-highlight">{interest}</span>', 
-                summary_text, 
-                flags=re.IGNORECASE
-            )
-    
-    return summary_text
+    return highlight_interests(summary_text, interests)
 
-def generate_summary(text, length="medium", reading_level="medium", interests=None):
-    """Generate a summary of the text based on user preferences."""
-    # Clean the text
-    text = clean_text(text)
+def generate_summary(text, length="medium", reading_level="medium", interests=None, engine="ai"):
+    """Generate a summary of cleaned text based on user preferences."""
+    if engine == "extractive":
+        # Local engine: no API calls at all
+        return {
+            'summary': generate_basic_summary(text, length, reading_level, interests),
+            'key_topics': extract_key_topics_basic(text)
+        }
     
     # Try to generate summary with AI
     try:
-        # Extract key topics with AI
-        key_topics = extract_key_topics_with_ai(text)
+        if SUMMARY_MODE == "derived":
+            return generate_derived_summary(text, length, reading_level, interests)
+        
+        # Long articles go through a map-reduce pass instead of being truncated
+        reduced_text = reduce_long_text(text)
+        
+        if local_topics_ready():
+            # Topics come from the full article locally, so the LLM only writes the summary
+            topics_future = submit(extract_key_topics_basic, text)
+            summary_text = generate_ai_summary(reduced_text, length, reading_level, interests)
+            return {
+                'summary': summary_text,
+                'key_topics': topics_future.result()
+            }
+        
+        if SUMMARY_MODE == "combined":
+            try:
+                # One round trip for both summary and topics
+                return generate_combined_summary_with_ai(reduced_text, length, reading_level, interests)
+            except ValueError as e:
+                logging.error(f"Combined AI summary returned malformed output: {str(e)}")
         
-        # Generate summary using OpenAI
-        summary_text = generate_ai_summary(text, length, reading_level, interests)
+        # Run key topic extraction and summary generation concurrently
+        topics_future = submit(extract_key_topics_with_ai, reduced_text)
+        summary_future = submit(generate_ai_summary, reduced_text, length, reading_level, interests)
+        key_topics = topics_future.result()
+        summary_text = summary_future.result()
         
         return {
             'summary': summary_text,
@@ -0,0 +1,332 @@
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+
+from utils import LazyEngine
+
+# Local key topic configuration
+TOPIC_HASH_BUCKETS = int(os.environ.get("TOPIC_HASH_BUCKETS", str(1 << 21)))
+TOPIC_MIN_DOCUMENTS = int(os.environ.get("TOPIC_MIN_DOCUMENTS", "50"))
+TOPIC_FLUSH_DOCUMENTS = int(os.environ.get("TOPIC_FLUSH_DOCUMENTS", "10"))
+TOPIC_REFRESH_SECONDS = float(os.environ.get("TOPIC_REFRESH_SECONDS", "300"))
+
+# BM25 term frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Longest phrase offered as a topic
+MAX_PHRASE_WORDS = 3
+
+# Reserved buckets holding the document count and the total word count of the corpus
+_DOCUMENTS = -1
+_WORDS = -2
+
+# Words, plus the punctuation that ends a phrase
+_TOKEN_RE = re.compile(r"\w+(?:['’-]\w+)*|[.,;:!?()\[\]\"“”]")
+_TAG_RE = re.compile(r'<[^>]*>')
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each even ever every few for from further
+get gets got had has have having he her here hers herself him himself his how however i if in into is it
+its itself just last least less like made make many may me might more most much must my myself new no
+nor not now of off often on once one only or other our ours ourselves out over own per said same say
+says she should since so some still such than that the their theirs them themselves then there these
+they this those through to too two under until up upon us very via was we were what when where which
+while who whom whose why will with within without would year years yet you your yours yourself
+""".split())
+
+def candidate_runs(text):
+    """Runs of consecutive content words, split at punctuation, stopwords and numbers, plus the word count."""
+    runs = []
+    run = []
+    words = 0
+    for token in _TOKEN_RE.findall(_TAG_RE.sub(' ', text or '').lower()):
+        if token[0].isalnum() or token[0] == '_':
+            words += 1
+            if len(token) > 2 and token not in STOPWORDS and not token.isdigit():
+                run.append(token)
+                continue
+        if run:
+            runs.append(run)
+            run = []
+    if run:
+        runs.append(run)
+    return runs, words
+
+def candidate_terms(runs, max_words=MAX_PHRASE_WORDS):
+    """Count every phrase of up to max_words inside the runs."""
+    counts = Counter()
+    for run in runs:
+        for size in range(1, max_words + 1):
+            for i in range(len(run) - size + 1):
+                counts[' '.join(run[i:i + size])] += 1
+    return counts
+
+def term_bucket(term, buckets=TOPIC_HASH_BUCKETS):
+    return zlib.crc32(term.encode('utf-8')) % buckets
+
+class TopicIndex(LazyEngine):
+    """Corpus document frequencies of words and two-word phrases, for BM25 key topic extraction.
+
+    Terms are hashed into a fixed number of buckets, so counts live in one flat array in memory and
+    one row per used bucket in the database. Collisions can only overstate a term's document count.
+    Each distinct article is counted once, however often it is summarized; counts are never decremented.
+    """
+
+    def __init__(self, buckets=TOPIC_HASH_BUCKETS):
+        self.buckets = buckets
+        self.app = None
+        self.db = None
+        self.model = None
+        self.document_model = None
+        self.counts = None
+        self.documents = 0
+        self.words = 0
+        self.loaded_at = 0.0
+        # Increments not yet written to the database, keyed by bucket
+        self.pending = Counter()
+        self.pending_documents = 0
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+
+    def init_app(self, app, db, model, document_model, summary_model):
+        """Attach the frequency and counted-article tables and count new articles as they are stored."""
+        self.app = app
+        self.db = db
+        self.model = model
+        self.document_model = document_model
+        event.listen(summary_model, 'after_insert', self._queue_row)
+        # Counted and written after the summary's transaction commits, so none of it lengthens that transaction
+        event.listen(db.session, 'after_commit', self._count_committed)
+        event.listen(db.session, 'after_rollback', self._drop_queued)
+
+    def _queue_row(self, mapper, connection, target):
+        # Only the text is kept during the flush; tokenizing waits for the commit
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault('topic_texts', []).append(target.original_text)
+
+    def _count_committed(self, session):
+        texts = session.info.pop('topic_texts', None)
+        if not texts:
+            return
+        try:
+            for text in self.new_documents(texts):
+                self.add_document(text)
+        except Exception as e:
+            logging.error(f"Topic statistics update failed: {str(e)}")
+        if self.pending_documents >= TOPIC_FLUSH_DOCUMENTS:
+            self.flush()
+
+    def _drop_queued(self, session):
+        session.info.pop('topic_texts', None)
+
+    def new_documents(self, texts):
+        """The texts not counted before, recording their hashes so no process counts them again."""
+        hashed = {}
+        for text in texts:
+            if text:
+                hashed.setdefault(hashlib.sha1(' '.join(text.split()).encode('utf-8')).hexdigest(), text)
+        if not hashed:
+            return []
+        table = self.document_model.__table__
+        new = []
+        with self.engine.begin() as conn:
+            if conn.dialect.name in ('sqlite', 'postgresql'):
+                # Import here so only the dialect in use is loaded
+                if conn.dialect.name == 'sqlite':
+                    from sqlalchemy.dialects.sqlite import insert
+                else:
+                    from sqlalchemy.dialects.postgresql import insert
+                for content_hash, text in hashed.items():
+                    if conn.execute(insert(table).values(content_hash=content_hash).on_conflict_do_nothing()).rowcount:
+                        new.append(text)
+                return new
+            seen = set(conn.execute(
+                self.db.select(table.c.content_hash).where(table.c.content_hash.in_(list(hashed)))
+            ).scalars())
+            for content_hash, text in hashed.items():
+                if content_hash not in seen:
+                    conn.execute(table.insert().values(content_hash=content_hash))
+                    new.append(text)
+        return new
+
+    def document_buckets(self, text):
+        """Distinct buckets of the words and two-word phrases of a text, and its word count."""
+        runs, words = candidate_runs(text)
+        return {term_bucket(term, self.buckets) for term in candidate_terms(runs, 2)}, words
+
+    def add_document(self, text):
+        """Count one article. The in-memory counts change at once; the database on the next flush."""
+        if not text:
+            return
+        buckets, words = self.document_buckets(text)
+        with self.lock:
+            for bucket in buckets:
+                self.pending[bucket] += 1
+            self.pending[_DOCUMENTS] += 1
+            self.pending[_WORDS] += words
+            self.pending_documents += 1
+            if self.counts is not None:
+                for bucket in buckets:
+                    self.counts[bucket] += 1
+                self.documents += 1
+                self.words += words
+
+    def flush(self):
+        """Add the pending increments to the frequency table."""
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+            self.pending_documents = 0
+        if self.db is None or not pending:
+            return
+        rows = [{'bucket': bucket, 'documents': count, 'updated_at': time.time()} for bucket, count in pending.items()]
+        try:
+            with self.engine.begin() as conn:
+                self._upsert(conn, rows)
+        except Exception as e:
+            logging.error(f"Topic statistics write failed: {str(e)}")
+
+    def _upsert(self, conn, rows):
+        table = self.model.__table__
+        if conn.dialect.name in ('sqlite', 'postgresql'):
+            # Import here so only the dialect in use is loaded
+            if conn.dialect.name == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            statement = insert(table)
+            conn.execute(statement.on_conflict_do_update(
+                index_elements=[table.c.bucket],
+                set_={
+                    'documents': table.c.documents + statement.excluded.documents,
+                    'updated_at': statement.excluded.updated_at,
+                }
+            ), rows)
+            return
+        for row in rows:
+            updated = conn.execute(table.update().where(table.c.bucket == row['bucket']).values(
+                documents=table.c.documents + row['documents'], updated_at=row['updated_at']
+            ))
+            if not updated.rowcount:
+                conn.execute(table.insert().values(**row))
+
+    def backfill(self, content_model):
+        """Count articles stored before the table existed. Call inside an app context.
+
+        Databases counted before article hashes were kept only get the hashes, so those articles are not counted again.
+        """
+        table = self.model.__table__
+        documents = self.document_model.__table__
+        with self.engine.connect() as conn:
+            counted = conn.execute(self.db.select(table.c.bucket).limit(1)).first() is not None
+            hashed = conn.execute(self.db.select(documents.c.content_hash).limit(1)).first() is not None
+        if counted and hashed:
+            return
+        key = inspect(content_model).primary_key[0]
+        last = None
+        while True:
+            # Whole pages, so no read cursor stays open while the counts are written (SQLite would refuse the write)
+            query = self.db.select(content_model).order_by(key).limit(500)
+            if last is not None:
+                query = query.where(key > last)
+            contents = self.db.session.execute(query).scalars().all()
+            if not contents:
+                break
+            last = getattr(contents[-1], key.key)
+            for text in self.new_documents([content.get_text() for content in contents]):
+                if not counted:
+                    self.add_document(text)
+            self.flush()
+
+    def refresh(self):
+        """Load the counts from the database, or pick up rows other processes changed since the last load."""
+        if self.db is None:
+            return
+        # Only one thread refreshes; the others keep using the counts they have
+        if not self.refresh_lock.acquire(blocking=self.counts is None):
+            return
+        try:
+            if self.counts is not None and time.time() - self.loaded_at < TOPIC_REFRESH_SECONDS:
+                return
+            self.flush()
+            table = self.model.__table__
+            started = time.time()
+            query = self.db.select(table.c.bucket, table.c.documents)
+            if self.counts is not None:
+                # Allow for transactions that were still committing during the last load
+                query = query.where(table.c.updated_at >= self.loaded_at - 60)
+            counts = self.counts if self.counts is not None else array('I', bytes(4 * self.buckets))
+            with self.engine.connect() as conn:
+                rows = conn.execute(query).all()
+            with self.lock:
+                for bucket, documents in rows:
+                    if bucket == _DOCUMENTS:
+                        self.documents = documents
+                    elif bucket == _WORDS:
+                        self.words = documents
+                    elif 0 <= bucket < self.buckets:
+                        counts[bucket] = documents
+                self.counts = counts
+                self.loaded_at = started
+        except Exception as e:
+            logging.error(f"Topic statistics load failed: {str(e)}")
+        finally:
+            self.refresh_lock.release()
+
+    def is_ready(self):
+        """Whether the corpus is large enough for its statistics to pick topics."""
+        self.refresh()
+        return self.documents >= TOPIC_MIN_DOCUMENTS
+
+    def document_frequency(self, term):
+        if self.counts is None:
+            return 0
+        words = term.split(' ')
+        if len(words) <= 2:
+            return self.counts[term_bucket(term, self.buckets)]
+        # Longer phrases are not counted; no phrase occurs in more articles than any two-word part of it
+        return min(self.counts[term_bucket(' '.join(words[i:i + 2]), self.buckets)] for i in range(len(words) - 1))
+
+    def key_topics(self, text, n=5):
+        """The n phrases of a text with the highest BM25 weight against the corpus."""
+        self.refresh()
+        runs, words = candidate_runs(text)
+        counts = candidate_terms(runs)
+        documents = self.documents
+        average_words = self.words / documents if documents else max(words, 1)
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * words / max(average_words, 1))
+
+        scores = {}
+        for term, tf in counts.items():
+            # A phrase seen once is as likely to be chance as a topic
+            if tf < 2 and ' ' in term:
+                continue
+            df = min(self.document_frequency(term), documents)
+            idf = math.log(1 + (documents - df + 0.5) / (df + 0.5))
+            scores[term] = idf * tf * (BM25_K1 + 1) / (tf + length_norm)
+
+        topics = []
+        for term in sorted(scores, key=scores.get, reverse=True):
+            # Skip phrases that repeat part of an earlier, higher-scoring topic
+            padded = f" {term} "
+            if any(padded in f" {chosen} " or f" {chosen} " in padded for chosen in topics):
+                continue
+            topics.append(term)
+            if len(topics) == n:
+                break
+        return topics
+
+# Shared topic index
+topic_index = TopicIndex()
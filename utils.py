@@ -46,4 +46,19 @@ def get_interest_categories():
 
 def format_date(date):
     """Format a datetime object to a readable string."""
-    return date.strftime("%B %d, %Y %H:%M")
\ No newline at end of file
+    return date.strftime("%B %d, %Y %H:%M")
+
+class LazyEngine:
+    """Mixin for shared helpers set up with init_app: resolves the app's database engine on first use.
+
+    The engine is kept, so pool threads without an app context can reach the database. Needs self.app and self.db.
+    """
+
+    _engine = None
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            with self.app.app_context():
+                self._engine = self.db.engine
+        return self._engine
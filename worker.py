@@ -0,0 +1,205 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, update
+
+from budget import token_budget
+from main import app, db, Job, Summary, generate_summary, extract_article_from_url
+
+# Worker configuration
+WORKER_THREADS = int(os.environ.get("WORKER_THREADS", "4"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1.0"))
+JOB_TIMEOUT = int(os.environ.get("JOB_TIMEOUT", "300"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+# Running jobs renew their heartbeat this often; one silent for JOB_TIMEOUT is treated as abandoned
+JOB_HEARTBEAT_INTERVAL = float(os.environ.get("JOB_HEARTBEAT_INTERVAL", str(JOB_TIMEOUT / 3)))
+
+def claim_next_job():
+    """Atomically move the oldest queued job to running and return its id."""
+    candidates = db.session.execute(
+        db.select(Job.id)
+        .where(Job.status == "queued")
+        .order_by(Job.id)
+        .limit(WORKER_THREADS)
+    ).scalars().all()
+
+    for job_id in candidates:
+        # The status guard makes the claim safe across threads and processes
+        result = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == "queued")
+            .values(
+                status="running",
+                date_started=datetime.now(timezone.utc),
+                heartbeat_at=datetime.now(timezone.utc),
+                attempts=Job.attempts + 1
+            )
+        )
+        db.session.commit()
+        if result.rowcount == 1:
+            return job_id
+    return None
+
+def requeue_stale_jobs():
+    """Requeue jobs whose worker stopped renewing the heartbeat, or fail them after too many attempts."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=JOB_TIMEOUT)
+    # Jobs claimed before heartbeats existed only have a start time
+    stale = func.coalesce(Job.heartbeat_at, Job.date_started) < cutoff
+    db.session.execute(
+        update(Job)
+        .where(Job.status == "running", stale, Job.attempts < JOB_MAX_ATTEMPTS)
+        .values(status="queued")
+    )
+    db.session.execute(
+        update(Job)
+        .where(Job.status == "running", stale, Job.attempts >= JOB_MAX_ATTEMPTS)
+        .values(status="failed", error="Job timed out", date_finished=datetime.now(timezone.utc))
+    )
+    db.session.commit()
+
+def claimed(job_id, attempt):
+    """Condition that still holds while this attempt owns the job; a requeue or a new claim breaks it."""
+    return (Job.id == job_id) & (Job.status == "running") & (Job.attempts == attempt)
+
+@contextmanager
+def heartbeat(job_id, attempt):
+    """Renew the job's heartbeat from a background thread until the block exits."""
+    stop = threading.Event()
+    engine = db.engine
+
+    def renew():
+        while not stop.wait(JOB_HEARTBEAT_INTERVAL):
+            try:
+                with engine.begin() as conn:
+                    conn.execute(update(Job).where(claimed(job_id, attempt)).values(heartbeat_at=datetime.now(timezone.utc)))
+            except Exception as e:
+                logging.error(f"Job {job_id} heartbeat failed: {str(e)}")
+
+    thread = threading.Thread(target=renew, name=f"job-heartbeat-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+def process_job(job_id):
+    """Fetch, summarize and store the result of a single job."""
+    job = db.session.get(Job, job_id)
+    attempt = job.attempts
+    try:
+        with heartbeat(job_id, attempt):
+            if job.source_url:
+                article, error = extract_article_from_url(job.source_url)
+                if error:
+                    raise ValueError(f"Error extracting article: {error}")
+                title = article['title']
+                original_text = article['text']
+            else:
+                title = job.title or 'Custom Text'
+                original_text = job.original_text
+
+            interests = [interest.strip() for interest in (job.interests or 'general').split(',')]
+            # The budget may have run out while the job was queued
+            engine = token_budget.engine_for(job.user_id, job.engine or "ai")
+            with token_budget.meter(job.user_id):
+                summary_result = generate_summary(
+                    original_text,
+                    length=job.summary_length,
+                    reading_level=job.reading_level,
+                    interests=interests,
+                    engine=engine
+                )
+
+        summary = Summary(
+            title=title,
+            original_text=original_text,
+            summarized_text=summary_result['summary'],
+            source_url=job.source_url,
+            summary_length=job.summary_length,
+            reading_level=job.reading_level,
+            key_topics=','.join(summary_result['key_topics']),
+            user_id=job.user_id
+        )
+        db.session.add(summary)
+        db.session.flush()
+
+        # Saved only if no other worker took the job over, so a job never stores two summaries
+        finished = db.session.execute(
+            update(Job)
+            .where(claimed(job_id, attempt))
+            # The job no longer needs its own copy of the input
+            .values(status="done", summary_id=summary.id, original_text=None, date_finished=datetime.now(timezone.utc))
+        )
+        if finished.rowcount != 1:
+            db.session.rollback()
+            logging.warning(f"Job {job_id} was taken over by another worker; dropping this result")
+            return
+        db.session.commit()
+    except Exception as e:
+        logging.error(f"Job {job_id} failed: {str(e)}")
+        db.session.rollback()
+        # Retried by the next free worker until the attempts run out
+        retry = attempt < JOB_MAX_ATTEMPTS
+        db.session.execute(
+            update(Job)
+            .where(claimed(job_id, attempt))
+            .values(
+                status="queued" if retry else "failed",
+                error=str(e),
+                date_finished=None if retry else datetime.now(timezone.utc)
+            )
+        )
+        db.session.commit()
+
+def worker_loop(stop_event):
+    """Poll for queued jobs until asked to stop."""
+    with app.app_context():
+        while not stop_event.is_set():
+            try:
+                job_id = claim_next_job()
+            except Exception as e:
+                logging.error(f"Failed to claim job: {str(e)}")
+                db.session.rollback()
+                job_id = None
+
+            if job_id is None:
+                stop_event.wait(JOB_POLL_INTERVAL)
+                continue
+
+            process_job(job_id)
+            # Release the connection between jobs
+            db.session.remove()
+
+def run_worker():
+    """Run a pool of worker threads in this process."""
+    stop_event = threading.Event()
+
+    with app.app_context():
+        requeue_stale_jobs()
+
+    threads = [
+        threading.Thread(target=worker_loop, args=(stop_event,), name=f"summary-worker-{i}", daemon=True)
+        for i in range(WORKER_THREADS)
+    ]
+    for thread in threads:
+        thread.start()
+    logging.info(f"Started {WORKER_THREADS} summary worker threads")
+
+    try:
+        while True:
+            time.sleep(JOB_TIMEOUT)
+            with app.app_context():
+                requeue_stale_jobs()
+    except KeyboardInterrupt:
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_worker()